@@ -1,8 +1,10 @@
 from django.contrib import admin
 from django.shortcuts import render
 from django.urls import path
+from django.utils import timezone
 
 from . import models
+from . import gateway
 
 
 class SubmissionAdmin(admin.ModelAdmin):
@@ -47,7 +49,11 @@ class JournalAdmin(admin.ModelAdmin):
             path(
                 "register_journal/",
                 self.admin_site.admin_view(self.register_journal_view),
-            )
+            ),
+            path(
+                "gateway_status/",
+                self.admin_site.admin_view(self.gateway_status_view),
+            ),
         ]
         urls = extra_urls + urls
         return urls
@@ -56,5 +62,41 @@ class JournalAdmin(admin.ModelAdmin):
         response = {}
         return render(request, "admin/ojs/register_journals.html", response)
 
+    def gateway_status_view(self, request):
+        response = {
+            "breakers": gateway.get_breaker_states(),
+            "queues": gateway.get_queue_stats(),
+        }
+        return render(request, "admin/ojs/gateway_status.html", response)
+
 
 admin.site.register(models.Journal, JournalAdmin)
+
+
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "endpoint",
+        "journal",
+        "state",
+        "attempts",
+        "next_attempt",
+        "last_error",
+    )
+    list_filter = ("state", "endpoint")
+    actions = ["requeue"]
+
+    @admin.action(description="Deliver selected messages again")
+    def requeue(self, request, queryset):
+        # Messages that OJS has received but whose response could not be
+        # processed have failed with a delivery time. They must not be sent
+        # again.
+        queryset.exclude(state="delivered").filter(delivered=None).update(
+            state="pending",
+            attempts=0,
+            next_attempt=timezone.now(),
+            locked_until=None,
+        )
+
+
+admin.site.register(models.OutboxMessage, OutboxMessageAdmin)
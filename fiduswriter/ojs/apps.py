@@ -1,6 +1,17 @@
+import atexit
+
 from django.apps import AppConfig
 
 
 class Config(AppConfig):
     name = "ojs"
     default_auto_field = "django.db.models.AutoField"
+
+    def ready(self):
+        from . import gateway
+        from . import signals  # noqa: F401
+
+        # Django has no shutdown signal, and the ASGI servers Fidus Writer
+        # runs under do not send lifespan events to it, so the pooled OJS
+        # connections are closed when the process exits.
+        atexit.register(gateway.close_clients)
@@ -1,3 +1,4 @@
+OJS_PLUGIN_PATH = "/index.php/index/gateway/plugin/FidusWriterGatewayPlugin/"
 ROLE_ID_SITE_ADMIN = 1
 ROLE_ID_MANAGER = 16
 ROLE_ID_SUB_EDITOR = 17
@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict, namedtuple
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import models
+
+# Every call from OJS names a submission and has to be checked against the key
+# of the submission's journal. The journal data needed for this is cached per
+# submission in two tiers: a small in-process LRU cache in front of the shared
+# Django cache. Both are invalidated through signals when a journal or a
+# submission changes. The in-process tiers of other server processes only
+# notice after OJS_CREDENTIALS_LOCAL_TTL seconds. A local memory Django cache,
+# which Fidus Writer uses unless CACHES is set, is kept per process as well,
+# but would keep a changed key for OJS_CREDENTIALS_CACHE_TTL seconds, so it is
+# not used.
+
+SubmissionCredentials = namedtuple(
+    "SubmissionCredentials", ["journal_id", "ojs_key", "ojs_url", "editor_id"]
+)
+
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, max_age):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, added = entry
+            if monotonic() - added > max_age:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LRUCache(
+    getattr(settings, "OJS_CREDENTIALS_LOCAL_SIZE", 1024),
+)
+
+
+def is_shared_cache():
+    return not isinstance(caches["default"], LocMemCache)
+
+
+def get_cache_key(submission_id):
+    return f"ojs-submission-credentials-{submission_id}"
+
+
+# Return the journal data of a submission. Raises Submission.DoesNotExist if
+# there is no such submission.
+def get_submission_credentials(submission_id):
+    submission_id = int(submission_id)
+    credentials = local_cache.get(
+        submission_id, getattr(settings, "OJS_CREDENTIALS_LOCAL_TTL", 60)
+    )
+    if credentials is not None:
+        return credentials
+    shared = is_shared_cache()
+    cache_key = get_cache_key(submission_id)
+    values = cache.get(cache_key) if shared else None
+    if values is None:
+        values = (
+            models.Submission.objects.filter(id=submission_id)
+            .values_list(
+                "journal_id",
+                "journal__ojs_key",
+                "journal__ojs_url",
+                "journal__editor_id",
+            )
+            .first()
+        )
+        if values is None:
+            raise models.Submission.DoesNotExist
+        if shared:
+            cache.set(
+                cache_key,
+                values,
+                getattr(settings, "OJS_CREDENTIALS_CACHE_TTL", 24 * 60 * 60),
+            )
+    credentials = SubmissionCredentials(*values)
+    local_cache.set(submission_id, credentials)
+    return credentials
+
+
+def invalidate(submission_ids):
+    submission_ids = list(submission_ids)
+    for submission_id in submission_ids:
+        local_cache.delete(submission_id)
+    cache.delete_many([get_cache_key(id) for id in submission_ids])
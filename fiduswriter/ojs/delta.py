@@ -0,0 +1,91 @@
+import json
+from difflib import SequenceMatcher
+
+# Deltas between JSON values. They are used to store the documents of
+# superseded revisions as the changes against the preceding revision. A delta
+# is one of:
+# - {"v": value}: The new value replaces the old one.
+# - {"d": {key: delta}, "r": [key]}: A dict with the changed and added keys
+#   and the removed keys ("r" is left out if no key has been removed).
+# - {"l": [op]}: A list that is built from the ops in order. An op is one of
+#   ["c", start, end] to copy a slice of the old list, ["p", index, delta] to
+#   add a changed item of the old list and ["i", items] to add new items.
+
+
+def dumps(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def diff(old, new):
+    if isinstance(old, dict) and isinstance(new, dict):
+        delta = {
+            "d": {
+                key: diff(old[key], value) if key in old else {"v": value}
+                for key, value in new.items()
+                if key not in old or old[key] != value
+            }
+        }
+        removed = [key for key in old if key not in new]
+        if removed:
+            delta["r"] = removed
+        return delta
+    if isinstance(old, list) and isinstance(new, list):
+        return {"l": diff_list(old, new)}
+    return {"v": new}
+
+
+def diff_list(old, new):
+    ops = []
+
+    def insert(items):
+        if ops and ops[-1][0] == "i":
+            ops[-1][1] += items
+        else:
+            ops.append(["i", items])
+
+    matcher = SequenceMatcher(
+        None,
+        [dumps(item) for item in old],
+        [dumps(item) for item in new],
+        False,
+    )
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["c", i1, i2])
+        elif tag == "replace":
+            # Changed items are stored as deltas against the items they
+            # replace if both are containers.
+            for offset, item in enumerate(new[j1:j2]):
+                index = i1 + offset
+                if index < i2 and (
+                    isinstance(old[index], dict)
+                    and isinstance(item, dict)
+                    or isinstance(old[index], list)
+                    and isinstance(item, list)
+                ):
+                    ops.append(["p", index, diff(old[index], item)])
+                else:
+                    insert([item])
+        elif tag == "insert":
+            insert(new[j1:j2])
+    return ops
+
+
+def patch(old, delta):
+    if "v" in delta:
+        return delta["v"]
+    if "d" in delta:
+        removed = delta.get("r", [])
+        value = {key: item for key, item in old.items() if key not in removed}
+        for key, item_delta in delta["d"].items():
+            value[key] = patch(old.get(key), item_delta)
+        return value
+    value = []
+    for op in delta["l"]:
+        if op[0] == "c":
+            value += old[op[1] : op[2]]
+        elif op[0] == "p":
+            value.append(patch(old[op[1]], op[2]))
+        else:
+            value += op[1]
+    return value
@@ -0,0 +1,306 @@
+import asyncio
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from time import monotonic
+
+from httpx import AsyncClient, HTTPError, Limits
+
+from django.conf import settings
+from django.utils import timezone
+
+# Outbound connections to the gateway plugins of OJS installations.
+#
+# Clients are long-lived and shared by all requests going to the same OJS
+# host, so that connections are kept alive between calls. An AsyncClient is
+# bound to the event loop in which it first opened connections. Under ASGI
+# there is only one loop per process, but under WSGI every async view runs in
+# a loop of its own, so clients are kept apart by loop as well.
+_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def host_key(url):
+    # All journals of one OJS installation share a client, so the pool is
+    # keyed on the origin of the journal's ojs_url.
+    return f"{url.scheme}://{url.netloc.decode('ascii')}"
+
+
+# State is only kept for the hosts of registered journals, see
+# helpers.send_async. It is still limited to the OJS_GATEWAY_MAX_HOSTS hosts
+# used most recently. entries is an OrderedDict. Returns the entry for key,
+# creating it with create, and the entries that have been evicted.
+def get_host_entry(entries, key, create):
+    entry = entries.get(key)
+    if entry is None:
+        entry = entries[key] = create()
+    entries.move_to_end(key)
+    evicted = []
+    while len(entries) > getattr(settings, "OJS_GATEWAY_MAX_HOSTS", 100):
+        evicted.append(entries.popitem(last=False)[1])
+    return entry, evicted
+
+
+def create_client():
+    return AsyncClient(
+        http2=getattr(settings, "OJS_GATEWAY_HTTP2", False),
+        limits=Limits(
+            max_connections=getattr(
+                settings, "OJS_GATEWAY_MAX_CONNECTIONS", 20
+            ),
+            max_keepalive_connections=getattr(
+                settings, "OJS_GATEWAY_MAX_KEEPALIVE_CONNECTIONS", 10
+            ),
+            keepalive_expiry=getattr(
+                settings, "OJS_GATEWAY_KEEPALIVE_EXPIRY", 30
+            ),
+        ),
+    )
+
+
+# Return the client for an OJS host, creating it on first use. Evicted
+# clients are closed, which fails requests still running on them, so
+# OJS_GATEWAY_MAX_HOSTS should be well above the number of OJS hosts in use.
+def get_client(key):
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        loop_clients = _clients.setdefault(loop, OrderedDict())
+        if key in loop_clients and loop_clients[key].is_closed:
+            del loop_clients[key]
+        client, evicted = get_host_entry(loop_clients, key, create_client)
+    for evicted_client in evicted:
+        loop.create_task(evicted_client.aclose())
+    return client
+
+
+# Close all clients of the running event loop.
+async def aclose_clients():
+    with _clients_lock:
+        clients = _clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+async def aclose_all(clients):
+    await asyncio.gather(
+        *(client.aclose() for client in clients), return_exceptions=True
+    )
+
+
+# Close the clients of all event loops that are not running anymore. This is
+# called when the server process shuts down.
+def close_clients():
+    with _clients_lock:
+        loops = list(_clients.items())
+        _clients.clear()
+    for loop, clients in loops:
+        if loop.is_closed() or loop.is_running() or not clients:
+            continue
+        loop.run_until_complete(aclose_all(clients.values()))
+
+
+# Circuit breakers, one per OJS host. When an OJS installation keeps failing,
+# calls to it are refused for a while instead of each one waiting through the
+# full retry loop and holding on to a worker.
+class CircuitOpenError(HTTPError):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, key):
+        self.key = key
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.last_failure = None
+        self.last_error = ""
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def failure_threshold(self):
+        return getattr(settings, "OJS_CIRCUIT_FAILURE_THRESHOLD", 5)
+
+    @property
+    def reset_timeout(self):
+        return getattr(settings, "OJS_CIRCUIT_RESET_TIMEOUT", 30)
+
+    # Raise CircuitOpenError if no call should be made to the host right
+    # now. After the cool-down, a single trial call is let through.
+    def before_call(self):
+        with self.lock:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.reset_timeout - monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(
+                        f"OJS at {self.key} is unavailable. Calls are "
+                        f"suspended for another {int(remaining) + 1}s."
+                    )
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self.trial_running:
+                    raise CircuitOpenError(
+                        f"OJS at {self.key} is unavailable. Waiting for "
+                        "a trial call to finish."
+                    )
+                self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_running = False
+
+    def record_failure(self, error=""):
+        with self.lock:
+            self.failures += 1
+            self.last_failure = timezone.now()
+            self.last_error = str(error)
+            self.trial_running = False
+            if (
+                self.state == self.HALF_OPEN
+                or self.failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self.opened_at = monotonic()
+
+    # The call ended without telling anything about the health of the host,
+    # for example because it was cancelled.
+    def release(self):
+        with self.lock:
+            self.trial_running = False
+
+
+_breakers = OrderedDict()
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(key):
+    with _breakers_lock:
+        breaker, _evicted = get_host_entry(
+            _breakers, key, lambda: CircuitBreaker(key)
+        )
+    return breaker
+
+
+# State of all circuit breakers of this process, for diagnostics.
+def get_breaker_states():
+    with _breakers_lock:
+        breakers = sorted(_breakers.values(), key=lambda b: b.key)
+    states = []
+    for breaker in breakers:
+        with breaker.lock:
+            state = breaker.state
+            if (
+                state == breaker.OPEN
+                and monotonic() - breaker.opened_at >= breaker.reset_timeout
+            ):
+                state = breaker.HALF_OPEN
+            states.append(
+                {
+                    "host": breaker.key,
+                    "state": state,
+                    "failures": breaker.failures,
+                    "last_failure": breaker.last_failure,
+                    "last_error": breaker.last_error,
+                }
+            )
+    return states
+
+
+# Bound the number of concurrent requests to each OJS host. Further requests
+# wait in line. How long they had to wait is recorded per host.
+_semaphores = weakref.WeakKeyDictionary()
+_queue_stats = OrderedDict()
+_queue_stats_lock = threading.Lock()
+
+
+def get_semaphore(key):
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        loop_semaphores = _semaphores.setdefault(loop, OrderedDict())
+        semaphore, _evicted = get_host_entry(
+            loop_semaphores,
+            key,
+            lambda: asyncio.Semaphore(
+                getattr(settings, "OJS_GATEWAY_MAX_CONCURRENCY", 10)
+            ),
+        )
+    return semaphore
+
+
+def record_queue_wait(key, wait, waiting):
+    with _queue_stats_lock:
+        stats, _evicted = get_host_entry(
+            _queue_stats,
+            key,
+            lambda: {
+                "host": key,
+                "requests": 0,
+                "waiting": 0,
+                "total": 0,
+                "max": 0,
+            },
+        )
+        stats["waiting"] += waiting
+        if waiting < 0:
+            stats["requests"] += 1
+            stats["total"] += wait
+            stats["max"] = max(stats["max"], wait)
+
+
+@asynccontextmanager
+async def queue(key):
+    semaphore = get_semaphore(key)
+    started = monotonic()
+    record_queue_wait(key, 0, 1)
+    try:
+        await semaphore.acquire()
+    finally:
+        record_queue_wait(key, monotonic() - started, -1)
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+# Time requests spent waiting for a free slot, per OJS host, for
+# diagnostics.
+def get_queue_stats():
+    with _queue_stats_lock:
+        stats = sorted(_queue_stats.values(), key=lambda s: s["host"])
+        return [
+            {
+                "host": entry["host"],
+                "requests": entry["requests"],
+                "waiting": entry["waiting"],
+                "average_wait": (
+                    entry["total"] / entry["requests"]
+                    if entry["requests"]
+                    else 0
+                ),
+                "max_wait": entry["max"],
+            }
+            for entry in stats
+        ]
+
+
+# Identical idempotent requests that are made while one of them is still
+# running share its result instead of each being sent to OJS.
+_in_flight = weakref.WeakKeyDictionary()
+
+
+async def coalesce(key, send):
+    loop = asyncio.get_running_loop()
+    flights = _in_flight.setdefault(loop, {})
+    task = flights.get(key)
+    if task is None:
+        task = flights[key] = loop.create_task(send())
+        task.add_done_callback(lambda task: flights.pop(key, None))
+    # A caller going away must not cancel the request for the others.
+    return await asyncio.shield(task)
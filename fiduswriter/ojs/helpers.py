@@ -1,11 +1,68 @@
-from os import path
-from httpx import AsyncClient
-from tenacity import retry, stop_after_attempt, wait_fixed
+import json
+import logging
+from asyncio import sleep
+from contextlib import nullcontext
+from hashlib import sha256
+from time import monotonic, time
+from urllib.parse import urlencode
+from httpx import (
+    HTTPError,
+    HTTPStatusError,
+    NetworkError,
+    RemoteProtocolError,
+    Request,
+    Timeout,
+    TimeoutException,
+    TransportError,
+    URL,
+)
+from asgiref.sync import sync_to_async
+from tenacity import AsyncRetrying, retry_if_exception, wait_random_exponential
 
-from document.models import Document
+from document.consumers import WebsocketConsumer
+from document.models import AccessRight, Document
 from usermedia.models import Image, DocumentImage
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
 from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.http import parse_http_date_safe
+
+from . import constants
+from . import gateway
+from . import history
+from . import models
+
+logger = logging.getLogger(__name__)
+
+
+# Images of a submission that cannot be found are replaced with a placeholder
+# image. There is one placeholder image per uploader, which is recognized by
+# its checksum. It is looked up once per document, so that a placeholder
+# image that has been deleted in the meantime is created again.
+PLACEHOLDER_CHECKSUM = -1
+
+
+def get_placeholder_image(owner):
+    image = (
+        Image.objects.filter(uploader=owner, checksum=PLACEHOLDER_CHECKSUM)
+        .only("id")
+        .first()
+    )
+    if image is None:
+        image = Image(uploader=owner, checksum=PLACEHOLDER_CHECKSUM)
+        with open(finders.find("img/error.avif"), "rb") as f:
+            image.image.save("error.avif", File(f))
+    return image
+
+
+# The file operations happen outside of the event loop.
+async def aget_placeholder_image(owner):
+    return await sync_to_async(get_placeholder_image)(owner)
 
 
 def create_doc(
@@ -29,17 +86,17 @@ def create_doc(
     doc.comments = comments
     doc.save()
 
+    doc_images = {}
+    placeholder = None
     for image in images:
         if image is None:
-            image = Image()
-            image.uploader = owner
-            f = open(
-                path.join(settings.PROJECT_PATH, "base/static/img/error.png")
-            )
-            image.image.save("error.png", File(f))
-            image.save()
-
-        DocumentImage.objects.create(document=doc, image=image, title="")
+            if placeholder is None:
+                placeholder = get_placeholder_image(owner)
+            image = placeholder
+        doc_images.setdefault(
+            image.id, DocumentImage(document=doc, image=image, title="")
+        )
+    DocumentImage.objects.bulk_create(doc_images.values())
 
     return doc
 
@@ -65,33 +122,140 @@ async def create_doc_async(
     doc.comments = comments
     await doc.asave()
 
+    doc_images = {}
+    placeholder = None
     for image in images:
         if image is None:
-            image = Image()
-            image.uploader = owner
-            f = open(
-                path.join(settings.PROJECT_PATH, "base/static/img/error.png")
-            )
-            image.image.save("error.png", File(f))
-            await image.asave()
-
-        await DocumentImage.objects.acreate(
-            document=doc, image=image, title=""
+            if placeholder is None:
+                placeholder = await aget_placeholder_image(owner)
+            image = placeholder
+        doc_images.setdefault(
+            image.id, DocumentImage(document=doc, image=image, title="")
         )
+    await DocumentImage.objects.abulk_create(doc_images.values())
 
     return doc
 
 
+# Look up images by ID with a single query. Returns the images in the order
+# of the IDs, with None in place of the images that do not exist or do not
+# match the filters.
+async def get_images(image_ids, **filters):
+    found = await Image.objects.filter(**filters).ain_bulk(image_ids)
+    missing_ids = [id for id in image_ids if id not in found]
+    if missing_ids:
+        logger.warning(f"Images not found: {missing_ids}")
+    return [found.get(id) for id in image_ids]
+
+
+# Load a document including the latest changes of the editors in which it is
+# open.
+def get_current_document(document_id):
+    if document_id in WebsocketConsumer.sessions:
+        WebsocketConsumer.save_document(document_id)
+    return Document.objects.select_related("template").get(id=document_id)
+
+
+# The IDs of the images and bibliography entries used in document content,
+# including footnotes, in the order of their first use.
+def get_used_ids(content):
+    image_ids = {}
+    citation_ids = {}
+    nodes = [content]
+    while nodes:
+        node = nodes.pop()
+        attrs = node.get("attrs", {})
+        if node.get("type") == "citation":
+            for reference in attrs.get("references", []):
+                citation_ids[reference["id"]] = True
+        elif node.get("type") == "image" and attrs.get("image") is not False:
+            image_ids[attrs.get("image")] = True
+        elif node.get("type") == "footnote":
+            nodes += reversed(attrs.get("footnote") or [])
+        nodes += reversed(node.get("content", []))
+    return list(image_ids), list(citation_ids)
+
+
+# The content, bibliography and image IDs of a document to be submitted. Like
+# the native exporter, only the bibliography entries and images that are
+# used in the document are included.
+def shrink_doc(document):
+    image_ids, citation_ids = get_used_ids(document.content)
+    bibliography = {}
+    for citation_id in citation_ids:
+        entry = document.bibliography.get(str(citation_id))
+        if entry is None:
+            continue
+        entry = dict(entry)
+        # The categories are only valid for one particular user.
+        entry.pop("cats", None)
+        bibliography[str(citation_id)] = entry
+    return document.content, bibliography, image_ids
+
+
+# Lock the rows of a queryset until the end of the transaction. The rows of
+# joined tables are not locked where the database supports this. With
+# skip_locked, rows locked by others are left out where this is supported.
+def select_for_update(queryset, skip_locked=False):
+    features = connection.features
+    return queryset.select_for_update(
+        skip_locked=skip_locked and features.has_select_for_update_skip_locked,
+        of=("self",) if features.has_select_for_update_of else (),
+    )
+
+
+# Copy a revision to a new version with a copy of its document. Author
+# information is removed from the document at the start of the review process
+# and added back after it.
 def copy_revision(revision, old_version_stage, new_version_stage, new_version):
-    images = []
-    doc_images = revision.document.documentimage_set.all()
-    for doc_image in doc_images:
-        images.append(doc_image.image)
+    document, contributors = copy_revision_document(
+        revision, old_version_stage, new_version_stage, new_version
+    )
+    return models.SubmissionRevision.objects.create(
+        submission=revision.submission,
+        version=new_version,
+        document=document,
+        contributors=contributors,
+    )
+
+
+# Create the document for a new version of a revision. Returns the document
+# and the contributor information kept with the new revision. On PostgreSQL,
+# the document is copied inside the database.
+def copy_revision_document(
+    revision, old_version_stage, new_version_stage, new_version
+):
+    if connection.vendor == "postgresql":
+        return copy_revision_in_db(
+            revision, old_version_stage, new_version_stage, new_version
+        )
+    return copy_revision_in_python(
+        revision, old_version_stage, new_version_stage, new_version
+    )
+
+
+def copy_revision_in_python(
+    revision, old_version_stage, new_version_stage, new_version
+):
+    deferred_fields = revision.document.get_deferred_fields() & {
+        "content",
+        "bibliography",
+        "comments",
+    }
+    if deferred_fields:
+        revision.document.refresh_from_db(fields=deferred_fields)
+    images = [
+        doc_image.image
+        for doc_image in revision.document.documentimage_set.select_related(
+            "image"
+        )
+    ]
     content = revision.document.content
+    contributors = revision.contributors
     if old_version_stage < 3 and new_version_stage == 3:
         # Remove author information at start of review process.
-        revision.contributors = {}
-        for part in content["content"]:
+        contributors = {}
+        for part in content.get("content", []):
             if (
                 "type" in part
                 and part["type"] == "contributors_part"
@@ -99,23 +263,21 @@ def copy_revision(revision, old_version_stage, new_version_stage, new_version):
                 and "attrs" in part
                 and "id" in part["attrs"]
             ):
-                revision.contributors[part["attrs"]["id"]] = part["content"]
+                contributors[part["attrs"]["id"]] = part["content"]
                 part["content"] = []
     elif (
-        old_version_stage == 3
-        and new_version_stage > 3
-        and len(revision.contributors)
+        old_version_stage == 3 and new_version_stage > 3 and len(contributors)
     ):
         # Readd author information after review process.
-        for part in content["content"]:
+        for part in content.get("content", []):
             if (
                 "type" in part
                 and part["type"] == "contributors_part"
                 and "attrs" in part
-                and part["attrs"]["id"] in revision.contributors
+                and part["attrs"]["id"] in contributors
             ):
-                part["content"] = revision.contributors[part["attrs"]["id"]]
-        revision.contributors = {}
+                part["content"] = contributors[part["attrs"]["id"]]
+        contributors = {}
     document = create_doc(
         revision.submission.journal.editor,
         revision.document.template,
@@ -127,19 +289,479 @@ def copy_revision(revision, old_version_stage, new_version_stage, new_version):
         revision.submission.id,
         new_version,
     )
+    return document, contributors
+
+
+# SQL to find the contributors parts of the content of a document that
+# contain author information. "part" is an element of the content.
+CONTRIBUTORS_PART_SQL = """
+    part->>'type' = 'contributors_part'
+    AND part ? 'content'
+    AND part->'attrs' ? 'id'
+"""
+
+
+# SQL for the content of a document with changed parts. part_sql is an
+# expression for the new version of a part.
+def get_parts_update_sql(part_sql):
+    return f"""
+        CASE WHEN jsonb_typeof(content->'content') = 'array' THEN
+            jsonb_set(content, '{{content}}', COALESCE((
+                SELECT jsonb_agg({part_sql} ORDER BY position)
+                FROM jsonb_array_elements(content->'content')
+                    WITH ORDINALITY AS parts(part, position)
+            ), '[]'::jsonb))
+        ELSE content END
+    """
+
+
+# The same as copy_revision_in_python, but without loading the document
+# content, bibliography and comments. These are copied and changed with
+# jsonb operations.
+def copy_revision_in_db(
+    revision, old_version_stage, new_version_stage, new_version
+):
+    qn = connection.ops.quote_name
+    document_table = qn(Document._meta.db_table)
+    content_params = []
+    contributors = revision.contributors
+    with connection.cursor() as cursor:
+        if old_version_stage < 3 and new_version_stage == 3:
+            # Remove author information at start of review process.
+            cursor.execute(
+                f"""
+                SELECT COALESCE(
+                    jsonb_object_agg(part->'attrs'->>'id', part->'content'),
+                    '{{}}'::jsonb
+                )
+                FROM {document_table},
+                    jsonb_array_elements(
+                        CASE WHEN jsonb_typeof(content->'content') = 'array'
+                        THEN content->'content' ELSE '[]'::jsonb END
+                    ) AS parts(part)
+                WHERE id = %s AND {CONTRIBUTORS_PART_SQL}
+                """,
+                [revision.document_id],
+            )
+            contributors = cursor.fetchone()[0]
+            if isinstance(contributors, str):
+                contributors = json.loads(contributors)
+            content_sql = get_parts_update_sql(
+                f"""
+                CASE WHEN {CONTRIBUTORS_PART_SQL}
+                THEN jsonb_set(part, '{{content}}', '[]'::jsonb)
+                ELSE part END
+                """
+            )
+        elif (
+            old_version_stage == 3
+            and new_version_stage > 3
+            and len(contributors)
+        ):
+            # Readd author information after review process.
+            content_sql = get_parts_update_sql(
+                """
+                CASE WHEN part->>'type' = 'contributors_part'
+                    AND part ? 'attrs'
+                    AND %s::jsonb ? (part->'attrs'->>'id')
+                THEN jsonb_set(
+                    part,
+                    '{content}',
+                    %s::jsonb -> (part->'attrs'->>'id')
+                )
+                ELSE part END
+                """
+            )
+            contributors_json = json.dumps(contributors)
+            content_params = [contributors_json, contributors_json]
+            contributors = {}
+        else:
+            content_sql = "content"
+
+        # The fields that are not copied are set like in create_doc.
+        title = revision.document.title
+        document = Document(
+            owner=revision.submission.journal.editor,
+            template_id=revision.document.template_id,
+            title=title,
+            path=f"/Submission {revision.submission.id}/{title.replace('/', '')} ({new_version})",
+        )
+        columns = []
+        values = []
+        params = []
+        for field in Document._meta.concrete_fields:
+            if field.primary_key:
+                continue
+            columns.append(qn(field.column))
+            if field.name == "content":
+                values.append(content_sql)
+                params += content_params
+            elif field.name in ("bibliography", "comments"):
+                values.append(qn(field.column))
+            else:
+                values.append("%s")
+                params.append(
+                    field.get_db_prep_save(
+                        field.pre_save(document, True), connection
+                    )
+                )
+        cursor.execute(
+            f"""
+            INSERT INTO {document_table} ({", ".join(columns)})
+            SELECT {", ".join(values)} FROM {document_table} WHERE id = %s
+            RETURNING id
+            """,
+            params + [revision.document_id],
+        )
+        document_id = cursor.fetchone()[0]
+
+        # Link the images of the document to the copy.
+        doc_image = DocumentImage(document_id=document_id, title="")
+        columns = []
+        values = []
+        params = []
+        for field in DocumentImage._meta.concrete_fields:
+            if field.primary_key:
+                continue
+            columns.append(qn(field.column))
+            if field.name == "image":
+                values.append(qn(field.column))
+            else:
+                values.append("%s")
+                params.append(
+                    field.get_db_prep_save(
+                        field.pre_save(doc_image, True), connection
+                    )
+                )
+        document_image_table = qn(DocumentImage._meta.db_table)
+        cursor.execute(
+            f"""
+            INSERT INTO {document_image_table} ({", ".join(columns)})
+            SELECT DISTINCT {", ".join(values)}
+            FROM {document_image_table} WHERE document_id = %s
+            """,
+            params + [revision.document_id],
+        )
 
-    # Copy revision
-    revision.pk = None
-    revision.document = document
-    revision.version = new_version
-    revision.save()
+    document = Document.objects.defer(
+        "content", "bibliography", "comments", "diffs"
+    ).get(id=document_id)
+    return document, contributors
 
+
+# Create the document of a pending revision, see OJS_LAZY_REVISIONS, or of a
+# compacted revision, see history.py. The revision is locked while its
+# document is created, so that this is only done once when several requests
+# ask for it at the same time. A pending source revision is materialized
+# first. Returns the revision with its document.
+def materialize_revision(revision_id):
+    revisions = models.SubmissionRevision.objects.select_related(
+        "submission__journal__editor", "document__template"
+    ).defer(
+        "document__content",
+        "document__bibliography",
+        "document__comments",
+        "document__diffs",
+    )
+    with transaction.atomic():
+        revision = select_for_update(revisions).get(id=revision_id)
+        if revision.document_id is not None:
+            return revision
+        compacted = models.CompactedRevision.objects.filter(
+            revision_id=revision.id
+        ).first()
+        if compacted is None:
+            source = materialize_revision(revision.source_id)
+            document, contributors = copy_revision_document(
+                source,
+                source.stage,
+                revision.stage,
+                revision.version,
+            )
+        else:
+            document = restore_document(revision, compacted)
+            contributors = revision.contributors
+        user_type = ContentType.objects.get_for_model(get_user_model())
+        AccessRight.objects.bulk_create(
+            [
+                AccessRight(
+                    document=document,
+                    holder_type=user_type,
+                    holder_id=int(user_id),
+                    path=document.path,
+                    rights=rights,
+                )
+                for user_id, rights in revision.pending_rights.items()
+            ]
+        )
+        revision.document = document
+        revision.contributors = contributors
+        revision.source = None
+        revision.pending_rights = {}
+        revision.save(
+            update_fields=[
+                "document",
+                "contributors",
+                "source",
+                "pending_rights",
+            ]
+        )
     return revision
 
 
-@retry(reraise=True, stop=stop_after_attempt(10), wait=wait_fixed(3))
-async def send_async(request, timeout=40):
-    async with AsyncClient(timeout=timeout) as client:
+# Create the document of a compacted revision again. The compacted revision
+# is kept, as the compacted revisions after it are based on it.
+def restore_document(revision, compacted):
+    fields = history.rebuild_fields(revision)
+    images = Image.objects.in_bulk(compacted.image_ids)
+    document = create_doc(
+        revision.submission.journal.editor,
+        compacted.template,
+        compacted.title,
+        fields["content"],
+        fields["bibliography"],
+        [images.get(image_id) for image_id in compacted.image_ids],
+        fields["comments"],
+        revision.submission.id,
+        revision.version,
+    )
+    if document.doc_version != compacted.doc_version:
+        document.doc_version = compacted.doc_version
+        document.save(update_fields=["doc_version"])
+    return document
+
+
+# A form POST to an endpoint of the gateway plugin of a journal's OJS server.
+def create_post_request(journal, endpoint, data):
+    return Request(
+        "POST",
+        f"{journal.ojs_url}{constants.OJS_PLUGIN_PATH}{endpoint}",
+        params={"key": journal.ojs_key},
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+        content=urlencode(data),
+    )
+
+
+# OJS has accepted a new submission. Store the IDs it uses for the submission
+# and its author and give the author read access to the submitted revision.
+async def register_submission(revision, user, response):
+    body_json = json.loads(response.content)
+    submission = revision.submission
+    submission.ojs_jid = body_json["submission_id"]
+
+    # We save the author ID on the OJS site. Currently we are NOT using
+    # this information for login purposes.
+    author = await models.Author.objects.filter(
+        submission=submission.id, ojs_jid=body_json["user_id"]
+    ).afirst()
+    if author is None:
+        await models.Author.objects.acreate(
+            user=user,
+            submission=submission,
+            ojs_jid=body_json["user_id"],
+        )
+        await AccessRight.objects.acreate(
+            document=revision.document,
+            holder_obj=user,
+            path=revision.document.path,
+            rights="read-without-comments",
+        )
+    # Saved last, so that the new author is included in the change.
+    await submission.asave()
+
+
+# Whether a failed call to OJS may succeed when repeated. This is the case if
+# OJS could not be reached, took too long or was temporarily unable to answer.
+# Other failures, such as a wrong key, are final.
+def is_retryable(error):
+    if isinstance(error, gateway.CircuitOpenError):
+        return False
+    if isinstance(
+        error, (NetworkError, TimeoutException, RemoteProtocolError)
+    ):
+        return True
+    if isinstance(error, HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return False
+
+
+# The number of seconds OJS asked us to wait before trying again, if any.
+def get_retry_after(error):
+    if not isinstance(error, HTTPStatusError):
+        return None
+    value = error.response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    timestamp = parse_http_date_safe(value)
+    if timestamp is None:
+        return None
+    return max(0, timestamp - time())
+
+
+# Requests that are not pooled are sent without waiting in line, see
+# send_async.
+async def send_once(client, key, request, timeout, pooled):
+    request.extensions["timeout"] = Timeout(timeout).as_dict()
+    async with gateway.queue(key) if pooled else nullcontext():
         response = await client.send(request)
-        response.raise_for_status()
+    response.raise_for_status()
+    return response
+
+
+# Whether a failed call tells that the OJS host is in trouble, as opposed to
+# having answered properly.
+def is_host_failure(error):
+    if isinstance(error, TransportError):
+        return True
+    return (
+        isinstance(error, HTTPStatusError) and error.response.is_server_error
+    )
+
+
+# Send a request to OJS, retrying with exponential backoff and jitter. The
+# deadline is the total number of seconds the call may take including all
+# retries, the timeout applies to each attempt. Requests to hosts that are not
+# known to run OJS are not pooled: they are sent with a client of their own
+# and leave no state, such as a circuit breaker, behind in this process.
+async def send_async(request, timeout=None, deadline=None, pooled=True):
+    if request.method in ("GET", "HEAD"):
+        return await gateway.coalesce(
+            (
+                request.method,
+                str(request.url),
+                tuple(sorted(request.headers.multi_items())),
+            ),
+            lambda: send_with_retries(request, timeout, deadline, pooled),
+        )
+    return await send_with_retries(request, timeout, deadline, pooled)
+
+
+async def send_with_retries(request, timeout, deadline, pooled):
+    if timeout is None:
+        timeout = getattr(settings, "OJS_GATEWAY_TIMEOUT", 10)
+    if deadline is None:
+        deadline = getattr(settings, "OJS_GATEWAY_DEADLINE", 25)
+    max_attempts = getattr(settings, "OJS_GATEWAY_MAX_ATTEMPTS", 5)
+    ends = monotonic() + deadline
+    backoff = wait_random_exponential(multiplier=0.5, max=8)
+
+    def stop(retry_state):
+        remaining = ends - monotonic()
+        if retry_state.attempt_number >= max_attempts or remaining < 1:
+            return True
+        retry_after = get_retry_after(retry_state.outcome.exception())
+        return retry_after is not None and retry_after >= remaining
+
+    def wait(retry_state):
+        delay = get_retry_after(retry_state.outcome.exception())
+        if delay is None:
+            delay = backoff(retry_state)
+        return max(0, min(delay, ends - monotonic() - 1))
+
+    retrying = AsyncRetrying(
+        sleep=sleep,
+        reraise=True,
+        retry=retry_if_exception(is_retryable),
+        stop=stop,
+        wait=wait,
+    )
+    key = gateway.host_key(request.url)
+    # The circuit breaker counts calls, not attempts, so that a single call
+    # retrying against a flaky host does not open the circuit by itself.
+    if pooled:
+        breaker = gateway.get_breaker(key)
+    else:
+        breaker = gateway.CircuitBreaker(key)
+    breaker.before_call()
+    client = gateway.get_client(key) if pooled else gateway.create_client()
+    try:
+        async for attempt in retrying:
+            with attempt:
+                response = await send_once(
+                    client,
+                    key,
+                    request,
+                    min(timeout, max(ends - monotonic(), 1)),
+                    pooled,
+                )
+    except HTTPError as error:
+        if is_host_failure(error):
+            breaker.record_failure(error)
+        else:
+            breaker.record_success()
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    finally:
+        if not pooled:
+            await client.aclose()
+    breaker.record_success()
     return response
+
+
+# Whether a URL is on the OJS host of a registered journal.
+async def is_journal_host(url):
+    key = gateway.host_key(URL(url))
+    return await models.Journal.objects.filter(
+        Q(ojs_url=key) | Q(ojs_url__startswith=f"{key}/")
+    ).aexists()
+
+
+# Get the journals of an OJS server as JSON. Journals rarely change, so the
+# list is cached for OJS_JOURNALS_CACHE_TTL seconds and then revalidated with
+# the ETag/Last-Modified headers of the last response, if OJS sent any. If OJS
+# cannot be reached, the last known list is used. pooled is passed on to
+# send_async.
+async def get_journals(base_url, key, deadline=None, pooled=True):
+    cache_key = (
+        "ojs-journals-" + sha256(f"{base_url} {key}".encode()).hexdigest()
+    )
+    cached = await cache.aget(cache_key)
+    if cached and time() - cached["fetched"] < getattr(
+        settings, "OJS_JOURNALS_CACHE_TTL", 300
+    ):
+        return cached["body"]
+    headers = {}
+    if cached and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached["last_modified"]:
+        headers["If-Modified-Since"] = cached["last_modified"]
+    request = Request(
+        "GET",
+        f"{base_url}{constants.OJS_PLUGIN_PATH}journals",
+        params={"key": key},
+        headers=headers,
+    )
+    try:
+        response = await send_async(request, deadline=deadline, pooled=pooled)
+    except HTTPStatusError as error:
+        if not cached or (
+            error.response.status_code != 304 and not is_retryable(error)
+        ):
+            raise
+        response = None
+    except HTTPError:
+        if not cached:
+            raise
+        return cached["body"]
+    if response is None:
+        # Not modified, or OJS is temporarily unable to answer.
+        cached["fetched"] = time()
+    else:
+        cached = {
+            "body": response.content,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched": time(),
+        }
+    # The entry is kept beyond its TTL to have something to fall back on.
+    await cache.aset(
+        cache_key,
+        cached,
+        getattr(settings, "OJS_JOURNALS_CACHE_MAX_AGE", 7 * 24 * 60 * 60),
+    )
+    return cached["body"]
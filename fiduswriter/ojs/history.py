@@ -0,0 +1,150 @@
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from document.consumers import WebsocketConsumer
+from document.models import AccessRight, Document
+from usermedia.models import DocumentImage
+
+from . import delta
+from . import models
+
+# The documents of revisions that have been superseded by later revisions of
+# their submission can be compacted. The document is removed and its content,
+# bibliography and comments are kept in a CompactedRevision, as deltas against
+# the compacted revision before it. The access rights to the document are kept
+# with the revision, as for a pending revision. The revision gets a document
+# again when it is opened, see helpers.materialize_revision. The compacted
+# revisions are only read and written here, so Fidus Writer's documents never
+# hold anything but complete documents.
+
+COMPACTED_FIELDS = ["content", "bibliography", "comments"]
+
+
+# The compacted revisions of a submission by revision ID.
+def get_chain(submission_id):
+    return models.CompactedRevision.objects.filter(
+        revision__submission_id=submission_id
+    ).in_bulk()
+
+
+# The compacted fields of a revision, rebuilt from the compacted revisions in
+# chain that it is based on.
+def get_fields(chain, revision_id):
+    compacted_revisions = []
+    compacted = chain.get(revision_id)
+    while compacted is not None:
+        compacted_revisions.append(compacted)
+        compacted = chain.get(compacted.base_id)
+    fields = dict.fromkeys(COMPACTED_FIELDS)
+    for compacted in reversed(compacted_revisions):
+        fields = {
+            field: delta.patch(fields[field], compacted.deltas[field])
+            for field in COMPACTED_FIELDS
+        }
+    return fields
+
+
+# The compacted fields of a compacted revision.
+def rebuild_fields(revision):
+    return get_fields(get_chain(revision.submission_id), revision.id)
+
+
+# Compact the documents of the revisions of a submission that have been
+# superseded. The first and the current revision keep their documents, and so
+# do documents that are open in an editor of this process. Revisions that have
+# been opened since they were compacted are compacted again with their
+# current documents. Returns the number of removed documents.
+def compact_submission(submission_id):
+    user_type = ContentType.objects.get_for_model(get_user_model())
+    doc_version = Document._meta.get_field("doc_version").default
+    count = 0
+    with transaction.atomic():
+        revisions = list(
+            models.SubmissionRevision.objects.filter(
+                submission_id=submission_id
+            )
+            .order_by("stage", "round", "party")
+            .select_for_update()
+        )
+        chain = get_chain(submission_id)
+        # The last compacted revision and its fields, which are only rebuilt
+        # when they are needed.
+        base = None
+        base_fields = dict.fromkeys(COMPACTED_FIELDS)
+        changed = False
+        for revision in revisions[1:-1]:
+            compacted = chain.get(revision.id)
+            document = None
+            if (
+                revision.document_id is not None
+                and revision.document_id not in WebsocketConsumer.sessions
+            ):
+                document = Document.objects.select_related("template").get(
+                    id=revision.document_id
+                )
+                if compacted is None and document.doc_version != doc_version:
+                    # The content has not been upgraded to the current format.
+                    continue
+                if document.template.user_id and document.template.auto_delete:
+                    # Fidus Writer deletes the template with its last document.
+                    continue
+            elif compacted is None:
+                # A pending revision or a document that is open.
+                continue
+            elif not changed:
+                # The compacted revision is stored already.
+                base, base_fields = compacted, None
+                continue
+            if document is None:
+                fields = get_fields(chain, revision.id)
+                template_id = compacted.template_id
+                title = compacted.title
+                content_version = compacted.doc_version
+                image_ids = compacted.image_ids
+            else:
+                fields = {
+                    field: getattr(document, field)
+                    for field in COMPACTED_FIELDS
+                }
+                template_id = document.template_id
+                title = document.title
+                content_version = document.doc_version
+                image_ids = list(
+                    DocumentImage.objects.filter(
+                        document_id=document.id
+                    ).values_list("image_id", flat=True)
+                )
+            if base_fields is None:
+                base_fields = get_fields(chain, base.pk)
+            models.CompactedRevision.objects.update_or_create(
+                revision=revision,
+                defaults={
+                    "base": base,
+                    "template_id": template_id,
+                    "title": title,
+                    "doc_version": content_version,
+                    "image_ids": image_ids,
+                    "deltas": {
+                        field: delta.diff(base_fields[field], fields[field])
+                        for field in COMPACTED_FIELDS
+                    },
+                },
+            )
+            base = models.CompactedRevision(pk=revision.id)
+            base_fields = fields
+            # The revisions after this one are stored against its new fields.
+            changed = True
+            if document is None:
+                continue
+            revision.pending_rights = {
+                str(holder_id): rights
+                for holder_id, rights in AccessRight.objects.filter(
+                    document_id=document.id, holder_type=user_type
+                ).values_list("holder_id", "rights")
+            }
+            revision.document = None
+            revision.save(update_fields=["document", "pending_rights"])
+            document.delete()
+            count += 1
+    return count
@@ -0,0 +1,194 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+
+from base.management import BaseCommand
+from document.models import Document, DocumentTemplate
+
+from ojs import models
+from ojs import views
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Show the query plans of the lookups made for calls from OJS with "
+        "and without the lookup indexes of the ojs app, on a seeded dataset. "
+        "Everything is done in a transaction that is rolled back. Needs "
+        "PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--revisions",
+            type=int,
+            dest="revisions",
+            default=100000,
+            help="Number of submission revisions to seed.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("The benchmark needs PostgreSQL.")
+        try:
+            with transaction.atomic():
+                self.run(options["revisions"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, number_of_revisions):
+        self.stdout.write(f"Seeding {number_of_revisions} revisions...")
+        submission, revision, user = self.seed(number_of_revisions)
+        after = self.explain_lookups(submission, revision, user)
+        self.drop_indexes()
+        before = self.explain_lookups(submission, revision, user)
+        for name in after:
+            self.stdout.write(f"\n{name}\n\nBefore:\n{before[name]}")
+            self.stdout.write(f"\nAfter:\n{after[name]}")
+
+    # Four revisions per submission, each with a document. Every submission
+    # has an author and two editors and every review revision a reviewer.
+    def seed(self, number_of_revisions):
+        User = get_user_model()
+        template = DocumentTemplate.objects.first()
+        if template is None:
+            raise CommandError("There needs to be a document template.")
+        users = User.objects.bulk_create(
+            [User(username=f"ojs-benchmark-{index}") for index in range(1000)]
+        )
+        journal = models.Journal.objects.create(
+            ojs_url="http://ojs-benchmark",
+            ojs_key="",
+            ojs_jid=1,
+            name="Benchmark",
+            editor=users[0],
+        )
+        versions = ["1.0.0", "3.0.0", "3.0.5", "4.0.0"]
+        version_parts = {
+            version: models.parse_version(version) for version in versions
+        }
+        submissions = models.Submission.objects.bulk_create(
+            [
+                models.Submission(
+                    submitter=users[index % len(users)],
+                    journal=journal,
+                    ojs_jid=index,
+                )
+                for index in range(number_of_revisions // len(versions))
+            ],
+            batch_size=1000,
+        )
+        documents = Document.objects.bulk_create(
+            [
+                Document(owner=journal.editor, template=template)
+                for _submission in submissions
+                for _version in versions
+            ],
+            batch_size=1000,
+        )
+        revisions = models.SubmissionRevision.objects.bulk_create(
+            [
+                models.SubmissionRevision(
+                    submission=submission,
+                    version=version,
+                    stage=version_parts[version][0],
+                    round=version_parts[version][1],
+                    party=version_parts[version][2],
+                    document=documents[index * len(versions) + offset],
+                )
+                for index, submission in enumerate(submissions)
+                for offset, version in enumerate(versions)
+            ],
+            batch_size=1000,
+        )
+        models.Author.objects.bulk_create(
+            [
+                models.Author(
+                    user=submission.submitter,
+                    submission=submission,
+                    ojs_jid=1,
+                )
+                for submission in submissions
+            ],
+            batch_size=1000,
+        )
+        models.Editor.objects.bulk_create(
+            [
+                models.Editor(
+                    user=users[(index + offset) % len(users)],
+                    submission=submission,
+                    ojs_jid=offset,
+                    role=16,
+                )
+                for index, submission in enumerate(submissions)
+                for offset in (2, 3)
+            ],
+            batch_size=1000,
+        )
+        models.Reviewer.objects.bulk_create(
+            [
+                models.Reviewer(
+                    user=users[index % len(users)],
+                    revision=revision,
+                    ojs_jid=4,
+                )
+                for index, revision in enumerate(revisions)
+                if revision.version == "3.0.0"
+            ],
+            batch_size=1000,
+        )
+        self.analyze()
+        revision = revisions[len(revisions) // 2]
+        return revision.submission, revision, revision.submission.submitter
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            for model in (
+                models.SubmissionRevision,
+                models.Author,
+                models.Editor,
+                models.Reviewer,
+            ):
+                cursor.execute(
+                    f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}"
+                )
+
+    def drop_indexes(self):
+        # Tables with pending foreign key checks cannot be altered.
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        with connection.schema_editor() as schema_editor:
+            schema_editor.alter_unique_together(
+                models.SubmissionRevision,
+                models.SubmissionRevision._meta.unique_together,
+                [],
+            )
+            for model in (
+                models.SubmissionRevision,
+                models.Author,
+                models.Editor,
+                models.Reviewer,
+            ):
+                for index in model._meta.indexes:
+                    schema_editor.remove_index(model, index)
+        self.analyze()
+
+    def explain_lookups(self, submission, revision, user):
+        return {
+            "Revision by version": models.SubmissionRevision.objects.filter(
+                submission_id=submission.id, version=revision.version
+            ).explain(),
+            "Latest revision": models.SubmissionRevision.objects.filter(
+                submission_id=submission.id
+            )
+            .order_by("-stage", "-round", "-party")[:1]
+            .explain(),
+            # Including the roles of the user.
+            "Revision by document": views.get_revisions_with_roles(
+                user, [revision.document_id]
+            ).explain(),
+        }
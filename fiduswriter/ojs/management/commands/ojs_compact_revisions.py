@@ -0,0 +1,19 @@
+from base.management import BaseCommand
+
+from ojs import history
+from ojs import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove the documents of superseded submission revisions and store "
+        "them as deltas against the preceding revisions."
+    )
+
+    def handle(self, *args, **options):
+        count = 0
+        for submission_id in list(
+            models.Submission.objects.values_list("id", flat=True)
+        ):
+            count += history.compact_submission(submission_id)
+        self.stdout.write(f"Compacted {count} revision documents.")
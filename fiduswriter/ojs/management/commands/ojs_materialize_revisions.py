@@ -0,0 +1,32 @@
+from base.management import BaseCommand
+
+from ojs import helpers
+from ojs import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the documents of revisions that have been recorded while "
+        "OJS_LAZY_REVISIONS is enabled."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            dest="limit",
+            default=None,
+            help="Maximum number of revisions to materialize.",
+        )
+
+    def handle(self, *args, **options):
+        revision_ids = models.SubmissionRevision.objects.filter(
+            document=None
+        ).values_list("id", flat=True)
+        if options["limit"] is not None:
+            revision_ids = revision_ids[: options["limit"]]
+        count = 0
+        for revision_id in list(revision_ids):
+            helpers.materialize_revision(revision_id)
+            count += 1
+        self.stdout.write(f"Materialized {count} revisions.")
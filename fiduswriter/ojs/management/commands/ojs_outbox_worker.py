@@ -0,0 +1,65 @@
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+
+from base.management import BaseCommand
+from django.db import close_old_connections
+
+from ojs import gateway
+from ojs import outbox
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver notifications to OJS that have been recorded while "
+        "OJS_OUTBOX is enabled."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            dest="once",
+            default=False,
+            help="Deliver all messages that are due and exit.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            dest="interval",
+            default=2,
+            help="Seconds to wait before checking for new messages.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            dest="concurrency",
+            default=10,
+            help="Number of OJS servers to deliver to at the same time.",
+        )
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options))
+
+    async def run(self, options):
+        try:
+            while True:
+                try:
+                    delivered = await outbox.deliver_due(
+                        options["concurrency"]
+                    )
+                except Exception:
+                    # For example, the database is not reachable right now.
+                    logger.exception("Delivering outbox messages failed")
+                    delivered = 0
+                    await sync_to_async(close_old_connections)()
+                if delivered:
+                    continue
+                if options["once"]:
+                    break
+                await asyncio.sleep(options["interval"])
+        finally:
+            await gateway.aclose_clients()
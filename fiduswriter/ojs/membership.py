@@ -0,0 +1,598 @@
+import re
+from collections import defaultdict
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, connection, transaction
+from django.db.models import IntegerField, Value
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from document.models import AccessRight
+
+from . import constants
+from . import helpers
+from . import models
+from . import push
+
+# Operations by which OJS adds and removes reviewers, editors and authors of a
+# submission. They are used both by the individual endpoints and by the batch
+# endpoint. Each operation takes a SubmissionContext and the parameters sent
+# by OJS and returns a status code and a response dict.
+
+
+# OJS may send the same call again while the first one is still being
+# processed. Rows are therefore inserted with upserts on their unique fields,
+# so that the second call updates the row inserted by the first one instead
+# of failing.
+def upsert_all(objs, unique_fields, update_fields):
+    if not connection.features.supports_update_conflicts_with_target:
+        # MySQL finds the conflicting row by any unique index.
+        unique_fields = None
+    type(objs[0]).objects.bulk_create(
+        objs,
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=update_fields,
+    )
+
+
+# Upsert a single row. Returns the object with its ID.
+def upsert(obj, unique_fields, update_fields):
+    upsert_all([obj], unique_fields, update_fields)
+    if obj.pk is None:
+        # The database does not return the IDs of upserted rows.
+        model = type(obj)
+        lookup = {}
+        for field in unique_fields:
+            attname = model._meta.get_field(field).attname
+            lookup[attname] = getattr(obj, attname)
+        obj.pk = model.objects.values_list("pk", flat=True).get(**lookup)
+    return obj
+
+
+# Data of a submission that is loaded once and shared by all operations of a
+# request. Changes to access rights are collected and written with bulk
+# queries when save() is called. The access rights to the document of a
+# pending revision are kept with the revision until its document is created.
+class SubmissionContext:
+    def __init__(self, submission_id):
+        self.submission_id = int(submission_id)
+        self.new_rights = []
+        self.changed_rights = []
+        self.removed_rights = []
+        self.pending_revisions = []
+        self.members_changed = False
+
+    # Forget the loaded data and the changes that have not been saved, after
+    # the changes of a failed operation have been rolled back.
+    def reset(self):
+        for name in ("revisions", "authors", "editors", "reviewers", "rights"):
+            self.__dict__.pop(name, None)
+        self.new_rights = []
+        self.changed_rights = []
+        self.removed_rights = []
+        self.pending_revisions = []
+        self.members_changed = False
+
+    # Revisions by version. The large JSON fields of the documents are not
+    # needed for managing members. The revisions are locked so that pending
+    # revisions cannot be materialized while their rights are changed.
+    @cached_property
+    def revisions(self):
+        revisions = (
+            models.SubmissionRevision.objects.filter(
+                submission_id=self.submission_id
+            )
+            .select_related("document")
+            .defer(
+                "document__content",
+                "document__bibliography",
+                "document__comments",
+                "document__diffs",
+            )
+        )
+        return {
+            revision.version: revision
+            for revision in helpers.select_for_update(revisions)
+        }
+
+    def get_revision(self, version):
+        revision = self.revisions.get(version)
+        if revision is None:
+            raise models.SubmissionRevision.DoesNotExist
+        return revision
+
+    @cached_property
+    def authors(self):
+        return {
+            author.ojs_jid: author
+            for author in models.Author.objects.filter(
+                submission_id=self.submission_id
+            ).select_related("user")
+        }
+
+    @cached_property
+    def editors(self):
+        return {
+            editor.ojs_jid: editor
+            for editor in models.Editor.objects.filter(
+                submission_id=self.submission_id
+            ).select_related("user")
+        }
+
+    @cached_property
+    def reviewers(self):
+        return {
+            (reviewer.revision_id, reviewer.ojs_jid): reviewer
+            for reviewer in models.Reviewer.objects.filter(
+                revision__submission_id=self.submission_id
+            ).select_related("user")
+        }
+
+    # Access rights of users to the revision documents, by document and user
+    # ID.
+    @cached_property
+    def rights(self):
+        removed = {
+            (document_id, user_id)
+            for document_ids, user_id in self.removed_rights
+            for document_id in document_ids
+        }
+        rights = {}
+        for right in AccessRight.objects.filter(
+            document_id__in=[
+                revision.document_id
+                for revision in self.revisions.values()
+                if revision.document_id is not None
+            ],
+            holder_type=self.user_type,
+        ):
+            key = (right.document_id, right.holder_id)
+            if key not in removed:
+                rights[key] = right
+        return rights
+
+    @cached_property
+    def user_type(self):
+        return ContentType.objects.get_for_model(get_user_model())
+
+    def has_rights(self, revision, user):
+        if revision.document_id is None:
+            return str(user.id) in revision.pending_rights
+        return (revision.document_id, user.id) in self.rights
+
+    # Record that the members of the submission have changed, which changes
+    # the submission info shown to them in the editor.
+    def change_members(self):
+        self.members_changed = True
+
+    def change_pending_rights(self, revision):
+        if revision not in self.pending_revisions:
+            self.pending_revisions.append(revision)
+
+    # Give a user the rights to the document of a revision. Returns whether a
+    # new access right was created.
+    def set_rights(self, revision, user, rights):
+        if revision.document_id is None:
+            created = str(user.id) not in revision.pending_rights
+            revision.pending_rights[str(user.id)] = rights
+            self.change_pending_rights(revision)
+            return created
+        document = revision.document
+        right = self.rights.get((document.id, user.id))
+        if right is None:
+            right = AccessRight(
+                document=document,
+                holder_obj=user,
+                path=document.path,
+                rights=rights,
+            )
+            self.rights[(document.id, user.id)] = right
+            self.new_rights.append(right)
+            return True
+        right.rights = rights
+        if right.pk and right not in self.changed_rights:
+            self.changed_rights.append(right)
+        return False
+
+    def remove_rights(self, revisions, user):
+        document_ids = []
+        for revision in revisions:
+            if revision.document_id is not None:
+                document_ids.append(revision.document_id)
+            elif str(user.id) in revision.pending_rights:
+                del revision.pending_rights[str(user.id)]
+                self.change_pending_rights(revision)
+        if "rights" in self.__dict__:
+            for document_id in document_ids:
+                right = self.rights.pop((document_id, user.id), None)
+                if right is None:
+                    continue
+                if not right.pk:
+                    self.new_rights.remove(right)
+                elif right in self.changed_rights:
+                    self.changed_rights.remove(right)
+        self.removed_rights.append((document_ids, user.id))
+
+    # Write the changed access rights and record a change of the members.
+    # Users who have the documents open are told about the changes once the
+    # transaction has been committed.
+    def save(self):
+        if self.members_changed:
+            models.Submission.objects.filter(id=self.submission_id).update(
+                modified=timezone.now()
+            )
+        changes = defaultdict(dict)
+        for document_ids, user_id in self.removed_rights:
+            AccessRight.objects.filter(
+                document_id__in=document_ids,
+                holder_type=self.user_type,
+                holder_id=user_id,
+            ).delete()
+            for document_id in document_ids:
+                changes[document_id][user_id] = None
+        if self.changed_rights:
+            AccessRight.objects.bulk_update(self.changed_rights, ["rights"])
+        if self.new_rights:
+            upsert_all(
+                self.new_rights,
+                ["document", "holder_type", "holder_id"],
+                ["rights"],
+            )
+        if self.pending_revisions:
+            models.SubmissionRevision.objects.bulk_update(
+                self.pending_revisions, ["pending_rights"]
+            )
+        for right in self.changed_rights + self.new_rights:
+            changes[right.document_id][right.holder_id] = right.rights
+        if changes:
+            transaction.on_commit(
+                partial(push.push_rights_changes, dict(changes))
+            )
+        self.new_rights = []
+        self.changed_rights = []
+        self.removed_rights = []
+        self.pending_revisions = []
+        self.members_changed = False
+
+
+# The roles through which an OJS user can be connected to a Fidus Writer user,
+# in the order in which they are looked up.
+MEMBER_ROLES = ["author", "reviewer", "editor"]
+
+
+# Find the Fidus Writer user that an OJS user is connected to on a
+# submission, and the role of the connection. Authors are preferred over
+# reviewers of the given version. Editors are only taken into account if
+# is_editor is set. All roles are looked up in a single query. Returns
+# (None, None) if the OJS user is not connected.
+def find_member(submission_id, version, ojs_jid, is_editor):
+    User = get_user_model()
+
+    def with_role(role, **filters):
+        return User.objects.filter(**filters).annotate(
+            role_index=Value(MEMBER_ROLES.index(role), IntegerField())
+        )
+
+    users = with_role(
+        "author",
+        author__submission_id=submission_id,
+        author__ojs_jid=ojs_jid,
+    ).union(
+        with_role(
+            "reviewer",
+            reviewer__revision__submission_id=submission_id,
+            reviewer__revision__version=version,
+            reviewer__ojs_jid=ojs_jid,
+        ),
+        all=True,
+    )
+    if is_editor:
+        users = users.union(
+            with_role(
+                "editor",
+                editor__submission_id=submission_id,
+                editor__ojs_jid=ojs_jid,
+            ),
+            all=True,
+        )
+    user = users.order_by("role_index").first()
+    if user is None:
+        return None, None
+    return user, MEMBER_ROLES[user.role_index]
+
+
+# Find an unused username, starting with the username used in OJS and then
+# adding a counter to it. The usernames that are in the way are fetched with
+# a single query.
+def get_free_username(username):
+    User = get_user_model()
+    taken = set(
+        User.objects.filter(
+            username__startswith=username,
+            username__regex=rf"^{re.escape(username)}[0-9]*$",
+        ).values_list("username", flat=True)
+    )
+    if username not in taken:
+        return username
+    counter = 0
+    while f"{username}{counter}" in taken:
+        counter += 1
+    return f"{username}{counter}"
+
+
+# The number of times creating a user is tried if the username is taken by a
+# concurrent request in the meantime.
+CREATE_USER_ATTEMPTS = 3
+
+
+# Return an existing user or create a new one. The email/username come from
+# OJS. We return an existing user if it has the same email as the OJS user
+# (ignoring case) as we expect OJS to have checked whether the user actually
+# has access to the email. We do not automatically connect to a user with the
+# same username, as this may be purely coincidental.
+# NOTE: An evil OJS editor can get access to accounts that he does not have
+# email access for this way.
+def get_or_create_user(email, username):
+    User = get_user_model()
+    for attempt in range(CREATE_USER_ATTEMPTS):
+        user_with_email = (
+            User.objects.filter(email__iexact=email).order_by("id").first()
+        )
+        if user_with_email:
+            return user_with_email
+        try:
+            with transaction.atomic():
+                return User.objects.create_user(
+                    get_free_username(username), email
+                )
+        except IntegrityError:
+            # Another request has created a user with the same username.
+            if attempt == CREATE_USER_ATTEMPTS - 1:
+                raise
+
+
+# A reviewer has accepted a review. Give comment/review access to the reviewer.
+def accept_reviewer(context, params):
+    response = {}
+    status = 200
+    revision = context.get_revision(params["version"])
+    ojs_jid = int(params.get("user_id"))
+    reviewer = context.reviewers.get((revision.id, ojs_jid))
+    if reviewer is None:
+        response["error"] = "Unknown reviewer"
+        status = 403
+        return status, response
+    review_method = params.get("review_method")
+
+    # ojs-fiduswriter < 3.0.0.0 specified "access_rights" instead of "review_method".
+    if not review_method:
+        if params.get("access_rights") == "comment":
+            review_method = "open"
+        else:
+            review_method = "doubleanonymous"
+
+    reviewer.method = review_method
+    reviewer.save()
+    context.change_members()
+
+    if review_method == "open":
+        rights = "comment"
+    else:
+        rights = "review"
+    # Make sure the connect document has reviewer access rights set for the
+    # user.
+    if context.set_rights(revision, reviewer.user, rights):
+        status = 201
+    return status, response
+
+
+# Add a reviewer to the document connected to a SubmissionRevision as a
+# reviewer.
+# Also ensure that there is an Reviewer set up for the account to allow for
+# password-less login from OJS.
+def add_reviewer(context, params):
+    response = {}
+    status = 200
+    revision = context.get_revision(params["version"])
+    ojs_jid = int(params.get("user_id"))
+
+    # Make sure there is an Reviewer/user registered for the reviewer.
+    reviewer = context.reviewers.get((revision.id, ojs_jid))
+    if reviewer is None:
+        user = get_or_create_user(params.get("email"), params.get("username"))
+        reviewer = upsert(
+            models.Reviewer(revision=revision, ojs_jid=ojs_jid, user=user),
+            ["revision", "ojs_jid"],
+            ["user"],
+        )
+        context.reviewers[(revision.id, ojs_jid)] = reviewer
+        context.change_members()
+        status = 201
+    # Make sure the connect document has reviewer access rights set for the
+    # user.
+    if context.set_rights(revision, reviewer.user, "read-without-comments"):
+        status = 201
+    return status, response
+
+
+def remove_reviewer(context, params):
+    response = {}
+    status = 200
+    revision = context.get_revision(params["version"])
+    ojs_jid = int(params.get("user_id"))
+    # Delete reviewer access rights set for the corresponding user,
+    # if there are any. Thereafter delete the Reviewer.
+    reviewer = context.reviewers.get((revision.id, ojs_jid))
+    if reviewer is None:
+        response["error"] = "Unknown reviewer"
+        status = 403
+        return status, response
+    context.remove_rights([revision], reviewer.user)
+    reviewer.delete()
+    del context.reviewers[(revision.id, ojs_jid)]
+    context.change_members()
+    return status, response
+
+
+# Add a editor connected to a submission
+# password-less login from OJS.
+def add_editor(context, params):
+    response = {}
+    status = 200
+    ojs_jid = int(params.get("user_id"))
+
+    # check, if editor account already exists
+    editor = context.editors.get(ojs_jid)
+
+    # if no editor exists, create one
+    if editor is None:
+        email = params.get("email")
+        username = params.get("username")
+        role = params.get("role")
+        user = get_or_create_user(email, username)
+        editor = upsert(
+            models.Editor(
+                user=user,
+                submission_id=context.submission_id,
+                ojs_jid=ojs_jid,
+                role=role,
+            ),
+            ["submission", "ojs_jid"],
+            ["user", "role"],
+        )
+        context.editors[ojs_jid] = editor
+        context.change_members()
+        status = 201
+
+    # create access_rights for existing revisions
+    # get ids of stages access granted
+    granted_stage_ids = [
+        int(stage_id)
+        for stage_id in params.get("stage_ids").split(",")
+        if stage_id.strip().isdigit()
+    ]
+    if granted_stage_ids:
+        for revision in context.revisions.values():
+            if revision.stage in granted_stage_ids and not context.has_rights(
+                revision, editor.user
+            ):
+                role = int(editor.role)
+                rights = constants.EDITOR_ROLE_STAGE_RIGHTS[role][
+                    revision.stage
+                ]
+                context.set_rights(revision, editor.user, rights)
+                status = 201
+
+    return status, response
+
+
+# Remove editor
+# password-less login from OJS.
+def remove_editor(context, params):
+    response = {}
+    status = 200
+    ojs_jid = int(params.get("user_id"))
+
+    # check, if editor account already exists
+    editor = context.editors.get(ojs_jid)
+    if editor is None:
+        response["error"] = "Unknown reviewer"
+        status = 403
+        return status, response
+
+    context.remove_rights(
+        context.revisions.values(),
+        editor.user,
+    )
+    editor.delete()
+    del context.editors[ojs_jid]
+    context.change_members()
+
+    return status, response
+
+
+# Add a author connected to a submission
+# password-less login from OJS.
+def add_author(context, params):
+    response = {}
+    status = 200
+    ojs_jid = int(params.get("user_id"))
+
+    # check, if author account already exists
+    author = context.authors.get(ojs_jid)
+
+    # if no author exists, create one
+    if author is None:
+        email = params.get("email")
+        username = params.get("username")
+        user = get_or_create_user(email, username)
+        author = upsert(
+            models.Author(
+                user=user,
+                submission_id=context.submission_id,
+                ojs_jid=ojs_jid,
+            ),
+            ["submission", "ojs_jid"],
+            ["user"],
+        )
+        context.authors[ojs_jid] = author
+        context.change_members()
+        status = 201
+
+    # create access_rights for existing revisions
+    # get ids of stages access granted
+    for revision in context.revisions.values():
+        if (
+            revision.stage == 1
+            or revision.stage == 4
+            or (revision.stage == 3 and revision.party == 5)
+        ) and not context.has_rights(revision, author.user):
+            if revision.stage == 1:
+                rights = "read-without-comments"
+            elif revision.stage == 3:
+                rights = "write"
+            else:
+                rights = "write-tracked"
+            context.set_rights(revision, author.user, rights)
+            status = 201
+
+    return status, response
+
+
+# Remove author
+# password-less login from OJS.
+def remove_author(context, params):
+    response = {}
+    status = 200
+    ojs_jid = int(params.get("user_id"))
+
+    # check, if author account already exists
+    author = context.authors.get(ojs_jid)
+    if author is None:
+        response["error"] = "Unknown reviewer"
+        status = 403
+        return status, response
+
+    context.remove_rights(
+        context.revisions.values(),
+        author.user,
+    )
+    author.delete()
+    del context.authors[ojs_jid]
+    context.change_members()
+
+    return status, response
+
+
+OPERATIONS = {
+    "accept_reviewer": accept_reviewer,
+    "add_reviewer": add_reviewer,
+    "remove_reviewer": remove_reviewer,
+    "add_editor": add_editor,
+    "remove_editor": remove_editor,
+    "add_author": add_author,
+    "remove_author": remove_author,
+}
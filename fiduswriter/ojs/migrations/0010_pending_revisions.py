@@ -0,0 +1,39 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ojs", "0009_outboxmessage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="submissionrevision",
+            name="pending_rights",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="submissionrevision",
+            name="source",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="ojs.submissionrevision",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="submissionrevision",
+            name="document",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="document.document",
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ojs", "0010_pending_revisions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompactedDocument",
+            fields=[
+                (
+                    "document",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="+",
+                        serialize=False,
+                        to="document.document",
+                    ),
+                ),
+                ("deltas", models.JSONField(default=dict)),
+                (
+                    "base",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="document.document",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.7 on 2026-10-18 13:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ojs", "0011_compacteddocument"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="submissionrevision",
+            unique_together={("submission", "version")},
+        ),
+        migrations.AddIndex(
+            model_name="author",
+            index=models.Index(
+                fields=["submission", "user"],
+                name="ojs_author_submiss_18e5ba_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="editor",
+            index=models.Index(
+                fields=["submission", "user"],
+                name="ojs_editor_submiss_9dc9fd_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reviewer",
+            index=models.Index(
+                fields=["revision", "user"],
+                name="ojs_reviewe_revisio_5e7837_idx",
+            ),
+        ),
+    ]
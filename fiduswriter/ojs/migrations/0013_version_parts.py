@@ -0,0 +1,55 @@
+# Generated by Django 5.1.7 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+def set_version_parts(apps, schema_editor):
+    SubmissionRevision = apps.get_model("ojs", "SubmissionRevision")
+    revisions = []
+    for revision in SubmissionRevision.objects.only(
+        "id", "version"
+    ).iterator():
+        revision.stage, revision.round, revision.party = (
+            int(part) for part in revision.version.split(".")
+        )
+        revisions.append(revision)
+        if len(revisions) == 1000:
+            SubmissionRevision.objects.bulk_update(
+                revisions, ["stage", "round", "party"]
+            )
+            revisions = []
+    SubmissionRevision.objects.bulk_update(
+        revisions, ["stage", "round", "party"]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ojs", "0012_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="submissionrevision",
+            name="party",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="submissionrevision",
+            name="round",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="submissionrevision",
+            name="stage",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(set_version_parts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="submissionrevision",
+            index=models.Index(
+                fields=["submission", "stage", "round", "party"],
+                name="ojs_submiss_submiss_f82fdd_idx",
+            ),
+        ),
+    ]
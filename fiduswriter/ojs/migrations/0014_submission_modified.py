@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ojs", "0013_version_parts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="journal",
+            name="modified",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="submission",
+            name="modified",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from ojs import delta
+
+COMPACTED_FIELDS = ["content", "bibliography", "comments"]
+
+
+# Compacted documents held a marker in place of their fields. Store their
+# fields in full again before the deltas are removed.
+def restore_compacted_documents(apps, schema_editor):
+    CompactedDocument = apps.get_model("ojs", "CompactedDocument")
+    Document = apps.get_model("document", "Document")
+    compacted_documents = CompactedDocument.objects.in_bulk()
+    restored = {}
+
+    def get_fields(document_id):
+        if document_id not in restored:
+            fields = Document.objects.values(*COMPACTED_FIELDS).get(
+                id=document_id
+            )
+            compacted = compacted_documents.get(document_id)
+            if compacted is not None:
+                base_fields = get_fields(compacted.base_id)
+                fields = {
+                    field: (
+                        delta.patch(
+                            base_fields[field], compacted.deltas[field]
+                        )
+                        if isinstance(value, dict) and "ojs_compacted" in value
+                        else value
+                    )
+                    for field, value in fields.items()
+                }
+            restored[document_id] = fields
+        return restored[document_id]
+
+    for document_id in compacted_documents:
+        Document.objects.filter(id=document_id).update(
+            **get_fields(document_id)
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("document", "0019_fidus_3_5"),
+        ("ojs", "0014_submission_modified"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            restore_compacted_documents, migrations.RunPython.noop
+        ),
+        migrations.DeleteModel(
+            name="CompactedDocument",
+        ),
+        migrations.CreateModel(
+            name="CompactedRevision",
+            fields=[
+                (
+                    "revision",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="compacted",
+                        serialize=False,
+                        to="ojs.submissionrevision",
+                    ),
+                ),
+                (
+                    "title",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                (
+                    "doc_version",
+                    models.DecimalField(decimal_places=1, max_digits=3),
+                ),
+                ("image_ids", models.JSONField(blank=True, default=list)),
+                ("deltas", models.JSONField(default=dict)),
+                (
+                    "base",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.RESTRICT,
+                        related_name="+",
+                        to="ojs.compactedrevision",
+                    ),
+                ),
+                (
+                    "template",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="document.documenttemplate",
+                    ),
+                ),
+            ],
+        ),
+    ]
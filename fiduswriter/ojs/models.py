@@ -1,6 +1,7 @@
 from django.db import models
 from django.db.models.deletion import CASCADE
 from django.conf import settings
+from django.utils import timezone
 
 from document.models import Document, DocumentTemplate
 
@@ -13,6 +14,8 @@ class Journal(models.Model):
     templates = models.ManyToManyField(DocumentTemplate)
     name = models.CharField(max_length=512)
     editor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=CASCADE)
+    # Last change, used to revalidate the editor's submission info.
+    modified = models.DateTimeField(auto_now=True)
 
     class Meta(object):
         unique_together = (("ojs_url", "ojs_jid"),)
@@ -26,6 +29,9 @@ class Submission(models.Model):
     submitter = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=CASCADE)
     journal = models.ForeignKey(Journal, on_delete=CASCADE)
     ojs_jid = models.PositiveIntegerField(default=0)  # ID in OJS
+    # Last change of the submission or its members, used to revalidate the
+    # editor's submission info.
+    modified = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return "{ojs_jid} in {journal} by {submitter}".format(
@@ -44,6 +50,7 @@ class Author(models.Model):
 
     class Meta(object):
         unique_together = ("submission", "ojs_jid")
+        indexes = [models.Index(fields=["submission", "user"])]
 
     def __str__(self):
         return "{username} ({ojs_jid})".format(
@@ -51,6 +58,12 @@ class Author(models.Model):
         )
 
 
+# The stage ID, round and party of a version as integers.
+def parse_version(version):
+    stage, round, party = (int(part) for part in version.split("."))
+    return stage, round, party
+
+
 # Within each submission, there is a new revision for each revision
 class SubmissionRevision(models.Model):
     submission = models.ForeignKey(Submission, on_delete=CASCADE)
@@ -62,9 +75,45 @@ class SubmissionRevision(models.Model):
     # The version should increase like a computer version number. Not all
     # numbers are included.
     version = models.CharField(max_length=8, default="1.0.0")
-    document = models.ForeignKey(Document, on_delete=CASCADE)
+    # The parts of the version, set from it when saving. Revisions are
+    # ordered by these.
+    stage = models.PositiveIntegerField(default=1)
+    round = models.PositiveIntegerField(default=0)
+    party = models.PositiveIntegerField(default=0)
+    # The document is missing while the revision is pending, see
+    # OJS_LAZY_REVISIONS.
+    document = models.ForeignKey(
+        Document, on_delete=CASCADE, null=True, blank=True
+    )
     # Contributor information if it has been removed from the document
     contributors = models.JSONField(default=dict)
+    # A pending revision has not been copied from its source revision yet.
+    # The access rights to give to its document are kept by user ID.
+    source = models.ForeignKey(
+        "self",
+        on_delete=CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    pending_rights = models.JSONField(default=dict, blank=True)
+
+    class Meta(object):
+        unique_together = ("submission", "version")
+        indexes = [
+            models.Index(fields=["submission", "stage", "round", "party"])
+        ]
+
+    def save(self, *args, **kwargs):
+        self.stage, self.round, self.party = parse_version(self.version)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "version" in update_fields:
+            kwargs["update_fields"] = set(update_fields) | {
+                "stage",
+                "round",
+                "party",
+            }
+        return super().save(*args, **kwargs)
 
     def __str__(self):
         return "{ojs_jid} (v{version}) in {journal} by {submitter}".format(
@@ -100,6 +149,7 @@ class Reviewer(models.Model):
 
     class Meta(object):
         unique_together = ("revision", "ojs_jid")
+        indexes = [models.Index(fields=["revision", "user"])]
 
     def __str__(self):
         return "{username} ({ojs_jid})".format(
@@ -119,6 +169,7 @@ class Editor(models.Model):
 
     class Meta(object):
         unique_together = ("submission", "ojs_jid")
+        indexes = [models.Index(fields=["submission", "user"])]
 
     def __str__(self):
         return "User: {username} (OJS User-ID: {user_id}), Submission: {ojs_jid} in {journal} by {submitter}".format(
@@ -128,3 +179,85 @@ class Editor(models.Model):
             journal=self.submission.journal.name,
             submitter=self.submission.submitter.username,
         )
+
+
+OUTBOX_STATES = [
+    ("pending", "Pending"),
+    ("delivered", "Delivered"),
+    ("failed", "Failed"),  # Given up on. Needs to be requeued manually.
+]
+
+
+# A notification to OJS that is delivered by the ojs_outbox_worker command.
+# Notifications are recorded in the same transaction as the changes on the
+# Fidus Writer side. Notifications to the same OJS server are delivered in
+# the order in which they were recorded.
+class OutboxMessage(models.Model):
+    journal = models.ForeignKey(Journal, on_delete=CASCADE)
+    # The gateway plugin endpoint, for example "authorSubmit".
+    endpoint = models.CharField(max_length=64)
+    data = models.JSONField(default=dict)
+    # The revision and user the notification is about, if any. These are
+    # needed to process the response from OJS.
+    revision = models.ForeignKey(
+        SubmissionRevision, on_delete=CASCADE, null=True, blank=True
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=CASCADE, null=True, blank=True
+    )
+    state = models.CharField(
+        max_length=9, default="pending", choices=OUTBOX_STATES
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    # Set while a worker is delivering the message.
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(default="", blank=True)
+    added = models.DateTimeField(auto_now_add=True)
+    delivered = models.DateTimeField(null=True, blank=True)
+
+    class Meta(object):
+        ordering = ["id"]
+        indexes = [models.Index(fields=["state", "next_attempt"])]
+
+    def __str__(self):
+        return "{endpoint} to {journal} ({state})".format(
+            endpoint=self.endpoint,
+            journal=self.journal.name,
+            state=self.state,
+        )
+
+
+# The document of a superseded revision, kept in place of the document while
+# the revision has none, see history.py. The content, bibliography and
+# comments are stored as deltas against the compacted revision before it, or
+# in full for the first compacted revision of a submission.
+class CompactedRevision(models.Model):
+    revision = models.OneToOneField(
+        SubmissionRevision,
+        on_delete=CASCADE,
+        primary_key=True,
+        related_name="compacted",
+    )
+    base = models.ForeignKey(
+        "self",
+        on_delete=models.RESTRICT,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    # The template is needed to rebuild the document.
+    template = models.ForeignKey(
+        DocumentTemplate, on_delete=models.PROTECT, related_name="+"
+    )
+    title = models.CharField(max_length=255, default="", blank=True)
+    # The format version of the content, see Document.doc_version.
+    doc_version = models.DecimalField(max_digits=3, decimal_places=1)
+    image_ids = models.JSONField(default=list, blank=True)
+    # Deltas of the compacted fields by field name.
+    deltas = models.JSONField(default=dict)
+
+    def __str__(self):
+        return "{revision} (based on {base})".format(
+            revision=self.revision_id, base=self.base_id
+        )
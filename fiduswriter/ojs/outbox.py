@@ -0,0 +1,174 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from httpx import HTTPError
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from . import gateway
+from . import helpers
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Notifications to OJS can be delivered by a background worker instead of
+# while the user waits. This is turned on with the OJS_OUTBOX setting and
+# requires the ojs_outbox_worker command to be running.
+
+
+def is_enabled():
+    return getattr(settings, "OJS_OUTBOX", False)
+
+
+# Record a notification. Call this inside the transaction that makes the
+# corresponding changes on the Fidus Writer side.
+def enqueue(journal, endpoint, data, revision=None, user=None):
+    return models.OutboxMessage.objects.create(
+        journal=journal,
+        endpoint=endpoint,
+        data=data,
+        revision=revision,
+        user=user,
+    )
+
+
+# Processing of the OJS response, by endpoint.
+async def process_author_submit(message, response):
+    if "submission_id" not in message.data:
+        # This was a first submission.
+        await helpers.register_submission(
+            message.revision, message.user, response
+        )
+
+
+RESPONSE_HANDLERS = {
+    "authorSubmit": process_author_submit,
+}
+
+
+# Claim the oldest due message of as many OJS servers as possible, up to
+# limit. Messages of one server are delivered one at a time and in order, so
+# a server is skipped entirely while its oldest message is waiting for a
+# retry or being delivered by another worker.
+def claim(limit):
+    now = timezone.now()
+    lease = timedelta(
+        seconds=getattr(settings, "OJS_GATEWAY_DEADLINE", 25) + 60
+    )
+    older_pending = models.OutboxMessage.objects.filter(
+        state="pending",
+        journal__ojs_url=OuterRef("journal__ojs_url"),
+        id__lt=OuterRef("id"),
+    )
+    due = (
+        models.OutboxMessage.objects.filter(
+            Q(locked_until=None) | Q(locked_until__lte=now),
+            ~Exists(older_pending),
+            state="pending",
+            next_attempt__lte=now,
+        )
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    # Messages that another worker is claiming at the same time are skipped.
+    with transaction.atomic():
+        claimed = list(
+            helpers.select_for_update(due, skip_locked=True)[:limit]
+        )
+        models.OutboxMessage.objects.filter(id__in=claimed).update(
+            locked_until=now + lease
+        )
+    return list(
+        models.OutboxMessage.objects.filter(id__in=claimed).select_related(
+            "journal", "revision__submission", "revision__document", "user"
+        )
+    )
+
+
+async def mark_delivered(message):
+    await models.OutboxMessage.objects.filter(id=message.id).aupdate(
+        state="delivered",
+        delivered=timezone.now(),
+        locked_until=None,
+        attempts=F("attempts") + 1,
+        last_error="",
+    )
+
+
+async def mark_failed(message, error):
+    attempts = message.attempts
+    if isinstance(error, gateway.CircuitOpenError):
+        # OJS has not been contacted, so this does not count as an attempt.
+        delay = getattr(settings, "OJS_CIRCUIT_RESET_TIMEOUT", 30)
+        state = "pending"
+    else:
+        attempts += 1
+        delay = min(2**attempts * 5, 3600)
+        if not helpers.is_retryable(error) or attempts >= getattr(
+            settings, "OJS_OUTBOX_MAX_ATTEMPTS", 10
+        ):
+            state = "failed"
+        else:
+            state = "pending"
+    await models.OutboxMessage.objects.filter(id=message.id).aupdate(
+        state=state,
+        attempts=attempts,
+        next_attempt=timezone.now() + timedelta(seconds=delay),
+        locked_until=None,
+        last_error=str(error) or error.__class__.__name__,
+    )
+    return state
+
+
+async def deliver(message):
+    try:
+        request = helpers.create_post_request(
+            message.journal, message.endpoint, message.data
+        )
+        response = await helpers.send_async(request)
+    except Exception as error:
+        state = await mark_failed(message, error)
+        logger.warning(
+            f"Delivery of outbox message {message.id} failed ({state}): "
+            f"{error}",
+            exc_info=not isinstance(error, HTTPError),
+        )
+        return
+    handler = RESPONSE_HANDLERS.get(message.endpoint)
+    try:
+        if handler:
+            await handler(message, response)
+    except Exception as error:
+        # OJS has received the notification, so it must not be sent again.
+        logger.exception(f"Processing outbox message {message.id} failed")
+        await models.OutboxMessage.objects.filter(id=message.id).aupdate(
+            state="failed",
+            delivered=timezone.now(),
+            locked_until=None,
+            last_error=f"Response could not be processed: {error}",
+        )
+        return
+    await mark_delivered(message)
+
+
+# Deliver one due message for each of up to limit OJS servers concurrently.
+# Returns the number of messages that were attempted. A message whose
+# delivery could not be recorded is attempted again once its lease expires.
+async def deliver_due(limit=10):
+    messages = await sync_to_async(claim)(limit)
+    results = await asyncio.gather(
+        *(deliver(message) for message in messages), return_exceptions=True
+    )
+    for message, result in zip(messages, results):
+        if isinstance(result, Exception):
+            logger.error(
+                f"Delivery of outbox message {message.id} could not be "
+                "recorded",
+                exc_info=result,
+            )
+    return len(messages)
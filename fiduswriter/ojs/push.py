@@ -0,0 +1,54 @@
+from document.consumers import WebsocketConsumer
+
+# Changes of the OJS state of a submission are pushed to the editors in which
+# the affected documents are open. This goes through the websocket
+# connections of Fidus Writer's document consumer, which keeps its sessions
+# in the memory of the server process and does not join any channel layer
+# groups. Pushes therefore only reach the editors connected to the process
+# that handles the change. Editors connected to other processes see the
+# change when they next load the submission info. Editors apply the changes
+# without reloading:
+# - "access_right" messages are handled by Fidus Writer itself.
+# - "ojs_submission" messages make EditorOJS fetch the submission info again.
+
+
+def get_participants(document_id):
+    session = WebsocketConsumer.sessions.get(document_id)
+    if not session:
+        return []
+    return list(session["participants"].values())
+
+
+# Send changed access rights to the users who have a document open. rights
+# maps user IDs to the new rights, or to None if the user has lost access.
+def push_rights(document_id, rights):
+    for participant in get_participants(document_id):
+        user_info = participant.user_info
+        if user_info.is_owner or participant.user.id not in rights:
+            continue
+        new_rights = rights[participant.user.id]
+        if new_rights is None:
+            participant.access_denied()
+            continue
+        if new_rights != user_info.access_rights:
+            user_info.access_rights = new_rights
+            participant.send_message(
+                {"type": "access_right", "access_right": new_rights}
+            )
+        participant.send_message({"type": "ojs_submission"})
+
+
+# Send the access rights changes of several documents, by document ID.
+def push_rights_changes(changes):
+    for document_id, rights in changes.items():
+        push_rights(document_id, rights)
+
+
+# Tell everyone who has a document open that the submission it belongs to
+# has changed. new_version is the version of a revision that has been added.
+def push_submission_change(document_id, new_version=None):
+    message = {"type": "ojs_submission"}
+    if new_version:
+        message["new_version"] = new_version
+    for participant in get_participants(document_id):
+        participant.send_message(dict(message))
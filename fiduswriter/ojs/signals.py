@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import credentials
+from . import models
+
+
+@receiver(post_save, sender=models.Submission)
+@receiver(post_delete, sender=models.Submission)
+def invalidate_submission_credentials(sender, instance, **kwargs):
+    credentials.invalidate([instance.id])
+
+
+@receiver(post_save, sender=models.Journal)
+@receiver(post_delete, sender=models.Journal)
+def invalidate_journal_credentials(sender, instance, **kwargs):
+    credentials.invalidate(
+        models.Submission.objects.filter(journal_id=instance.id).values_list(
+            "id", flat=True
+        )
+    )
@@ -3,8 +3,7 @@ import {
     activateWait,
     addAlert,
     deactivateWait,
-    post,
-    postJson
+    post
 } from "../common"
 import {COMMENT_ONLY_ROLES, READ_ONLY_ROLES} from "../editor"
 import {contributorInputPlugin} from "../editor/state_plugins"
@@ -24,16 +23,23 @@ export class EditorOJS {
             status: "unknown"
         }
         this.journals = false
+        this.etag = null
+        this.menuItem = null
     }
 
     init() {
-        const docData = {
-            doc_id: this.editor.docInfo.id
+        // The submission info of the last visit is used right away if it is
+        // available and revalidated in the background.
+        this.listenForChanges()
+        const storedDocInfo = this.getStoredDocInfo()
+        if (storedDocInfo) {
+            this.applyDocInfo(storedDocInfo)
+            this.updateDocInfo()
+            return this.setupUI()
         }
-        return postJson("/api/ojs/get_doc_info/", docData)
-            .then(({json}) => {
-                this.submission = json["submission"]
-                this.journals = json["journals"]
+        return this.fetchDocInfo(null)
+            .then(docInfo => {
+                this.applyDocInfo(docInfo)
                 return this.setupUI()
             })
             .catch(error => {
@@ -42,33 +48,235 @@ export class EditorOJS {
             })
     }
 
+    get docInfoStorageKey() {
+        return `ojs-doc-info-${this.editor.user.id}-${this.editor.docInfo.id}`
+    }
+
+    getStoredDocInfo() {
+        try {
+            return JSON.parse(
+                window.localStorage.getItem(this.docInfoStorageKey)
+            )
+        } catch (_error) {
+            return null
+        }
+    }
+
+    // Get the submission info from the server. If the stored info is still
+    // current, the server answers with 304 and the stored info is returned.
+    fetchDocInfo(storedDocInfo) {
+        const headers = {
+            Accept: "application/json",
+            "X-Requested-With": "XMLHttpRequest"
+        }
+        if (storedDocInfo) {
+            headers["If-None-Match"] = storedDocInfo.etag
+        }
+        return fetch(
+            `/api/ojs/get_doc_info/?doc_id=${this.editor.docInfo.id}`,
+            {
+                method: "GET",
+                headers,
+                credentials: "include",
+                cache: "no-store"
+            }
+        ).then(response => {
+            if (response.status === 304) {
+                return storedDocInfo
+            }
+            if (!response.ok) {
+                throw response
+            }
+            return response.json().then(json => {
+                const docInfo = {etag: response.headers.get("ETag"), json}
+                try {
+                    window.localStorage.setItem(
+                        this.docInfoStorageKey,
+                        JSON.stringify(docInfo)
+                    )
+                } catch (_error) {
+                    // Storage is full or disabled.
+                }
+                return docInfo
+            })
+        })
+    }
+
+    applyDocInfo({etag, json}) {
+        this.etag = etag
+        this.submission = json["submission"]
+        this.journals = json["journals"]
+    }
+
+    // Revalidate the submission info in the background and update the UI if
+    // it has changed.
+    updateDocInfo() {
+        return this.fetchDocInfo(this.getStoredDocInfo())
+            .then(docInfo => {
+                if (docInfo.etag === this.etag) {
+                    return
+                }
+                this.applyDocInfo(docInfo)
+                this.updateUI()
+            })
+            .catch(() => {})
+    }
+
+    // The server pushes changes of the submission through the document
+    // websocket. Changed access rights are handled by the editor itself. The
+    // websocket is only set up after the plugins have been initialized, so
+    // we wrap its message handler once it is assigned.
+    listenForChanges() {
+        const wrapReceiveData = ws => {
+            const receiveData = ws.receiveData
+            ws.receiveData = data => {
+                receiveData(data)
+                if (data.type === "ojs_submission") {
+                    this.receiveSubmissionChange(data)
+                }
+            }
+        }
+        if (this.editor.ws) {
+            wrapReceiveData(this.editor.ws)
+            return
+        }
+        let ws
+        Object.defineProperty(this.editor, "ws", {
+            configurable: true,
+            enumerable: true,
+            get: () => ws,
+            set: newWs => {
+                ws = newWs
+                if (ws) {
+                    wrapReceiveData(ws)
+                }
+            }
+        })
+    }
+
+    receiveSubmissionChange(data) {
+        if (data.new_version) {
+            addAlert(
+                "info",
+                interpolate(
+                    gettext(
+                        "A new revision (%(version)s) of this submission has been created."
+                    ),
+                    {version: data.new_version},
+                    true
+                )
+            )
+        }
+        this.updateDocInfo()
+    }
+
     setupUI() {
-        if (this.journals.length === 0) {
-            // This installation does not have any journals setup. Abort.
-            return Promise.resolve()
+        this.setStatePlugins()
+        this.setMenuItem()
+        return Promise.resolve()
+    }
+
+    // Apply changed submission info to the UI that has been set up already.
+    updateUI() {
+        if (this.setStatePlugins() && this.editor.view.state.plugins.length) {
+            // The document has been loaded with the previous plugins.
+            this.reconfigureState()
         }
-        if (
+        this.setMenuItem()
+        if (this.editor.menu.headerView) {
+            this.editor.menu.headerView.update()
+        }
+    }
+
+    // Whether the document is in the peer review stage of a submission.
+    get inReview() {
+        return (
+            this.journals.length > 0 &&
             this.submission.status === "submitted" &&
             this.submission.version.split(".")[0] === "3"
-        ) {
-            // We are in the peer review stage.
-            // replace contributorInputPlugin.
-            this.editor.statePlugins = this.editor.statePlugins.filter(
-                plugin => plugin[0] !== contributorInputPlugin
+        )
+    }
+
+    // In the peer review stage, the contributorInputPlugin is replaced by
+    // the reviewContributorPlugin. Returns whether the state plugins have
+    // changed.
+    setStatePlugins() {
+        const statePlugins = this.editor.statePlugins
+        const index = statePlugins.findIndex(plugin =>
+            [contributorInputPlugin, reviewContributorPlugin].includes(
+                plugin[0]
             )
-            this.editor.statePlugins.push([
+        )
+        let statePlugin
+        if (this.inReview) {
+            statePlugin = [
                 reviewContributorPlugin,
                 () => ({
                     editor: this,
                     contributors: this.submission.contributors
                 })
-            ])
+            ]
+        } else if (
+            index > -1 &&
+            statePlugins[index][0] === reviewContributorPlugin
+        ) {
+            statePlugin = [
+                contributorInputPlugin,
+                () => ({editor: this.editor})
+            ]
+        } else {
+            return false
         }
+        if (index > -1) {
+            statePlugins[index] = statePlugin
+        } else {
+            statePlugins.push(statePlugin)
+        }
+        return true
+    }
+
+    // Replace the contributor plugin of the loaded document by the one in
+    // the state plugins.
+    reconfigureState() {
+        const view = this.editor.view
+        const [pluginFunction, options] = this.editor.statePlugins.find(
+            plugin =>
+                [contributorInputPlugin, reviewContributorPlugin].includes(
+                    plugin[0]
+                )
+        )
+        const plugins = view.state.plugins
+            .filter(
+                plugin =>
+                    !plugin.key.startsWith("contributorInput$") &&
+                    !plugin.key.startsWith("reviewContributorInput$")
+            )
+            .concat(pluginFunction(options()))
+        view.updateState(view.state.reconfigure({plugins}))
+        // Needed to initialize the nodeViews of the new plugin.
+        view.setProps({nodeViews: {}})
+    }
 
+    // Add the submission item to the file menu if there are journals to
+    // submit to. Its state is taken from the current submission info.
+    setMenuItem() {
         const fileMenu = this.editor.menu.headerbarModel.content.find(
             menu => menu.id === "file"
         )
-        fileMenu.content.push({
+        if (this.journals.length === 0) {
+            // This installation does not have any journals setup.
+            if (this.menuItem) {
+                fileMenu.content = fileMenu.content.filter(
+                    item => item !== this.menuItem
+                )
+                this.menuItem = null
+            }
+            return
+        }
+        if (this.menuItem) {
+            return
+        }
+        this.menuItem = {
             title: gettext("Submit to journal"),
             type: "action",
             tooltip: gettext("Submit to journal"),
@@ -125,8 +333,8 @@ export class EditorOJS {
 
                 return false
             }
-        })
-        return Promise.resolve()
+        }
+        fileMenu.content.push(this.menuItem)
     }
 
     // Dialog for an article that has no submisison status. Includes selection of journal.
@@ -272,7 +480,7 @@ export class EditorOJS {
         })
             .then(() => {
                 addAlert("success", gettext("Editors are informed."))
-                window.setTimeout(() => window.location.reload(), 2000)
+                this.updateDocInfo()
             })
             .catch(error => {
                 addAlert("error", gettext("Updates could not be submitted."))
@@ -286,7 +494,7 @@ export class EditorOJS {
         })
             .then(() => {
                 addAlert("success", gettext("Resubmission successful"))
-                window.setTimeout(() => window.location.reload(), 2000)
+                this.updateDocInfo()
             })
             .catch(error => {
                 addAlert("error", gettext("Review could not be submitted."))
@@ -304,8 +512,6 @@ export class EditorOJS {
     }) {
         const submitter = new SendDocSubmission({
             doc: this.editor.getDoc(),
-            imageDB: this.editor.mod.db.imageDB,
-            bibDB: this.editor.mod.db.bibDB,
             journalId,
             firstname,
             lastname,
@@ -373,7 +579,7 @@ export class EditorOJS {
             .then(() => {
                 deactivateWait()
                 addAlert("success", gettext("Review submitted"))
-                window.setTimeout(() => window.location.reload(), 2000)
+                this.updateDocInfo()
             })
             .catch(error => {
                 addAlert("error", gettext("Review could not be submitted."))
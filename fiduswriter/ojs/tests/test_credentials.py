@@ -0,0 +1,90 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ojs import credentials
+from ojs import models
+
+
+class CredentialsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        credentials.local_cache.clear()
+        self.editor = get_user_model().objects.create_user(
+            "editor", "editor@x.com"
+        )
+        self.journal = self.create_journal(1, "KEY1")
+        self.submission = models.Submission.objects.create(
+            submitter=self.editor, journal=self.journal
+        )
+        self.submission_id = self.submission.id
+
+    def create_journal(self, ojs_jid, ojs_key):
+        return models.Journal.objects.create(
+            ojs_url="http://ojs",
+            ojs_key=ojs_key,
+            ojs_jid=ojs_jid,
+            name="Journal",
+            editor=self.editor,
+        )
+
+    def get_key(self):
+        return credentials.get_submission_credentials(
+            self.submission_id
+        ).ojs_key
+
+    @patch.object(credentials, "is_shared_cache", return_value=True)
+    def test_tiers(self, is_shared_cache):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_key(), "KEY1")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_key(), "KEY1")
+        credentials.local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_key(), "KEY1")
+
+    def test_local_memory_cache(self):
+        # The test settings use a local memory cache.
+        self.assertFalse(credentials.is_shared_cache())
+        self.get_key()
+        self.assertIsNone(
+            cache.get(credentials.get_cache_key(self.submission_id))
+        )
+        credentials.local_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_key(), "KEY1")
+
+    def test_journal_changes(self):
+        self.get_key()
+        self.journal.ojs_key = "KEY2"
+        self.journal.save()
+        self.assertEqual(self.get_key(), "KEY2")
+        self.journal.delete()
+        with self.assertRaises(models.Submission.DoesNotExist):
+            self.get_key()
+
+    def test_submission_changes(self):
+        self.get_key()
+        self.submission.journal = self.create_journal(2, "KEY2")
+        self.submission.save()
+        self.assertEqual(self.get_key(), "KEY2")
+        self.submission.delete()
+        with self.assertRaises(models.Submission.DoesNotExist):
+            self.get_key()
+
+    @override_settings(OJS_CREDENTIALS_LOCAL_TTL=60)
+    def test_local_ttl(self):
+        with patch.object(credentials, "monotonic", return_value=100):
+            self.get_key()
+        # A change made by another process without invalidating the
+        # in-process tier is only seen once the entry has expired.
+        models.Journal.objects.filter(id=self.journal.id).update(
+            ojs_key="KEY2"
+        )
+        cache.delete(credentials.get_cache_key(self.submission_id))
+        with patch.object(credentials, "monotonic", return_value=160):
+            self.assertEqual(self.get_key(), "KEY1")
+        with patch.object(credentials, "monotonic", return_value=161):
+            self.assertEqual(self.get_key(), "KEY2")
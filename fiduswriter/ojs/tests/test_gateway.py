@@ -0,0 +1,537 @@
+import asyncio
+from time import time
+from unittest.mock import AsyncMock, patch
+
+from httpx import (
+    URL,
+    AsyncClient,
+    ConnectError,
+    HTTPStatusError,
+    MockTransport,
+    ReadTimeout,
+    Request,
+    Response,
+)
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils.http import http_date
+
+from ojs import gateway
+from ojs import helpers
+from ojs import models
+
+
+class GatewayTestCase(SimpleTestCase):
+    def tearDown(self):
+        gateway.close_clients()
+        gateway._breakers.clear()
+        gateway._queue_stats.clear()
+
+
+# Sends requests to OJS through a mock transport. handler returns the
+# response to a request. The waits between retries only advance the clock of
+# the retry loop and are recorded in self.waits.
+class MockOJSTestCase(GatewayTestCase):
+    def setUp(self):
+        self.requests = []
+        self.handler = None
+        self.clock = 0
+
+        async def handle(request):
+            self.requests.append(request)
+            response = self.handler(request)
+            if asyncio.iscoroutine(response):
+                response = await response
+            return response
+
+        create_client = patch.object(
+            gateway,
+            "create_client",
+            lambda: AsyncClient(transport=MockTransport(handle)),
+        )
+        create_client.start()
+        self.addCleanup(create_client.stop)
+        monotonic = patch.object(helpers, "monotonic", lambda: self.clock)
+        monotonic.start()
+        self.addCleanup(monotonic.stop)
+
+        async def advance_clock(seconds):
+            self.clock += seconds
+
+        sleep = patch.object(
+            helpers, "sleep", AsyncMock(side_effect=advance_clock)
+        )
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    @property
+    def waits(self):
+        return [call.args[0] for call in self.sleep.await_args_list]
+
+    def send(
+        self, method="GET", url="http://ojs/journals", content=None, **kwargs
+    ):
+        async def run():
+            try:
+                return await helpers.send_async(
+                    Request(method, url, content=content), **kwargs
+                )
+            finally:
+                await gateway.aclose_clients()
+
+        return asyncio.run(run())
+
+
+class ClientTest(GatewayTestCase):
+    async def get_clients(self):
+        return (
+            gateway.get_client("http://a"),
+            gateway.get_client("http://a"),
+            gateway.get_client("http://b"),
+        )
+
+    def test_host_key(self):
+        self.assertEqual(
+            gateway.host_key(URL("https://ojs.org:8443/index.php/j?key=1")),
+            "https://ojs.org:8443",
+        )
+
+    def test_reuse(self):
+        loop = asyncio.new_event_loop()
+        other_loop = asyncio.new_event_loop()
+        try:
+            client, same_client, other_client = loop.run_until_complete(
+                self.get_clients()
+            )
+            self.assertIs(client, same_client)
+            self.assertIsNot(client, other_client)
+            # The clients of one loop cannot be used in another one.
+            other_loop_client = other_loop.run_until_complete(
+                self.get_clients()
+            )[0]
+            self.assertIsNot(other_loop_client, client)
+            gateway.close_clients()
+            for closed_client in (client, other_client, other_loop_client):
+                self.assertTrue(closed_client.is_closed)
+            new_client = loop.run_until_complete(self.get_clients())[0]
+            self.assertIsNot(new_client, client)
+        finally:
+            gateway.close_clients()
+            loop.close()
+            other_loop.close()
+
+    def test_aclose_clients(self):
+        async def run():
+            client = gateway.get_client("http://a")
+            await client.aclose()
+            # Closed clients are replaced.
+            new_client = gateway.get_client("http://a")
+            self.assertIsNot(new_client, client)
+            await gateway.aclose_clients()
+            self.assertTrue(new_client.is_closed)
+            self.assertIsNot(gateway.get_client("http://a"), new_client)
+            await gateway.aclose_clients()
+
+        asyncio.run(run())
+
+    @override_settings(OJS_GATEWAY_MAX_HOSTS=2)
+    def test_evict_hosts(self):
+        async def run():
+            client = gateway.get_client("http://a")
+            evicted_client = gateway.get_client("http://b")
+            gateway.get_client("http://a")
+            gateway.get_client("http://c")
+            # The least recently used client has been evicted and is closed.
+            await asyncio.sleep(0)
+            self.assertTrue(evicted_client.is_closed)
+            self.assertIs(gateway.get_client("http://a"), client)
+            await gateway.aclose_clients()
+
+        asyncio.run(run())
+        for key in ("http://a", "http://b", "http://a", "http://c"):
+            gateway.get_breaker(key)
+            gateway.record_queue_wait(key, 0, 1)
+        self.assertEqual(
+            [state["host"] for state in gateway.get_breaker_states()],
+            ["http://a", "http://c"],
+        )
+        self.assertEqual(
+            [stats["host"] for stats in gateway.get_queue_stats()],
+            ["http://a", "http://c"],
+        )
+
+
+@override_settings(
+    OJS_CIRCUIT_FAILURE_THRESHOLD=2, OJS_CIRCUIT_RESET_TIMEOUT=30
+)
+class CircuitBreakerTest(MockOJSTestCase):
+    def test_transitions(self):
+        breaker = gateway.get_breaker("http://ojs")
+        with patch.object(gateway, "monotonic", return_value=100):
+            breaker.before_call()
+            breaker.record_failure("HTTP 503")
+            self.assertEqual(breaker.state, breaker.CLOSED)
+            breaker.before_call()
+            breaker.record_failure("HTTP 503")
+            self.assertEqual(breaker.state, breaker.OPEN)
+            with self.assertRaises(gateway.CircuitOpenError):
+                breaker.before_call()
+        with patch.object(gateway, "monotonic", return_value=130):
+            self.assertEqual(
+                gateway.get_breaker_states()[0]["state"], breaker.HALF_OPEN
+            )
+            breaker.before_call()
+            self.assertEqual(breaker.state, breaker.HALF_OPEN)
+            # Only a single trial call is let through.
+            with self.assertRaises(gateway.CircuitOpenError):
+                breaker.before_call()
+            # A failed trial call opens the circuit again.
+            breaker.record_failure("HTTP 503")
+            self.assertEqual(breaker.state, breaker.OPEN)
+            with self.assertRaises(gateway.CircuitOpenError):
+                breaker.before_call()
+        with patch.object(gateway, "monotonic", return_value=160):
+            breaker.before_call()
+            # A cancelled trial call lets the next one through.
+            breaker.release()
+            breaker.before_call()
+            breaker.record_success()
+            self.assertEqual(breaker.state, breaker.CLOSED)
+            self.assertEqual(breaker.failures, 0)
+            breaker.before_call()
+            breaker.before_call()
+
+    @override_settings(
+        OJS_CIRCUIT_FAILURE_THRESHOLD=5, OJS_GATEWAY_MAX_ATTEMPTS=5
+    )
+    def test_retries_count_once(self):
+        self.handler = lambda request: Response(503)
+        for call in range(4):
+            with self.assertRaises(HTTPStatusError):
+                self.send()
+        breaker = gateway.get_breaker("http://ojs")
+        self.assertEqual(len(self.requests), 20)
+        self.assertEqual(breaker.failures, 4)
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        with self.assertRaises(HTTPStatusError):
+            self.send()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        with self.assertRaises(gateway.CircuitOpenError):
+            self.send()
+        self.assertEqual(len(self.requests), 25)
+
+    def test_answers_close_circuit(self):
+        responses = [Response(503), Response(404)]
+        self.handler = lambda request: responses.pop(0)
+        breaker = gateway.get_breaker("http://ojs")
+        breaker.record_failure("HTTP 503")
+        # OJS has answered the second attempt, so it is available.
+        with self.assertRaises(HTTPStatusError):
+            self.send()
+        self.assertEqual(breaker.failures, 0)
+
+
+class RetryTest(MockOJSTestCase):
+    def respond(self, *responses):
+        responses = list(responses)
+
+        def handler(request):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        self.handler = handler
+
+    def test_retry_after(self):
+        self.respond(
+            Response(429, headers={"Retry-After": "3"}),
+            Response(503, headers={"Retry-After": http_date(time() + 6)}),
+            Response(200),
+        )
+        self.assertEqual(self.send().status_code, 200)
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(self.waits[0], 3)
+        self.assertAlmostEqual(self.waits[1], 6, delta=1)
+
+    def test_server_errors(self):
+        self.respond(Response(500), Response(502), Response(200))
+        self.assertEqual(self.send().status_code, 200)
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(len(self.waits), 2)
+
+    def test_timeout(self):
+        self.respond(ReadTimeout("Too slow"), Response(200))
+        self.assertEqual(self.send(timeout=4).status_code, 200)
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(self.requests[0].extensions["timeout"]["read"], 4)
+
+    def test_deadline(self):
+        timeouts = []
+
+        def handler(request):
+            timeouts.append(request.extensions["timeout"]["read"])
+            return Response(503, headers={"Retry-After": "1"})
+
+        self.handler = handler
+        with self.assertRaises(HTTPStatusError):
+            self.send(timeout=4, deadline=3)
+        # The timeout of each attempt is cut to the time that is left, and
+        # no attempt is made with less than a second left.
+        self.assertEqual(self.waits, [1, 1])
+        self.assertEqual(timeouts, [3, 2, 1])
+        # A Retry-After beyond the deadline ends the call right away.
+        self.requests = []
+        self.respond(Response(503, headers={"Retry-After": "60"}))
+        with self.assertRaises(HTTPStatusError):
+            self.send(deadline=25)
+        self.assertEqual(len(self.requests), 1)
+
+    def test_client_error(self):
+        self.respond(Response(403))
+        with self.assertRaises(HTTPStatusError):
+            self.send()
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.waits, [])
+
+    def test_post(self):
+        # POST requests are retried on the same failures, which OJS is
+        # expected to have rejected before processing them.
+        self.respond(Response(503), Response(200))
+        response = self.send(
+            "POST", "http://ojs/authorSubmit", content=b"title=Title"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [request.content for request in self.requests],
+            [b"title=Title", b"title=Title"],
+        )
+        self.respond(Response(400))
+        with self.assertRaises(HTTPStatusError):
+            self.send("POST", "http://ojs/authorSubmit", content=b"")
+        self.assertEqual(len(self.requests), 3)
+
+
+class ConcurrencyTest(MockOJSTestCase):
+    def run_requests(self, *coroutines):
+        async def run():
+            try:
+                return await asyncio.gather(*coroutines)
+            finally:
+                await gateway.aclose_clients()
+
+        return asyncio.run(run())
+
+    def test_coalesce(self):
+        release = asyncio.Event()
+
+        async def handler(request):
+            await release.wait()
+            return Response(200, content=request.url.path.encode())
+
+        self.handler = handler
+
+        async def send(method, url):
+            return await helpers.send_async(Request(method, url))
+
+        async def release_later():
+            await asyncio.sleep(0.05)
+            release.set()
+
+        responses = self.run_requests(
+            send("GET", "http://ojs/journals"),
+            send("GET", "http://ojs/journals"),
+            send("GET", "http://ojs/journals"),
+            send("GET", "http://ojs/other"),
+            send("POST", "http://ojs/journals"),
+            send("POST", "http://ojs/journals"),
+            release_later(),
+        )
+        self.assertEqual(
+            [response.content for response in responses[:6]],
+            [b"/journals"] * 3 + [b"/other"] + [b"/journals"] * 2,
+        )
+        self.assertIs(responses[0], responses[1])
+        self.assertEqual(
+            sorted(
+                f"{request.method} {request.url.path}"
+                for request in self.requests
+            ),
+            [
+                "GET /journals",
+                "GET /other",
+                "POST /journals",
+                "POST /journals",
+            ],
+        )
+
+    def test_cancel_first_caller(self):
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def handler(request):
+            started.set()
+            await release.wait()
+            return Response(200)
+
+        self.handler = handler
+
+        async def run():
+            first = asyncio.create_task(
+                helpers.send_async(Request("GET", "http://ojs/journals"))
+            )
+            await started.wait()
+            second = asyncio.create_task(
+                helpers.send_async(Request("GET", "http://ojs/journals"))
+            )
+            await asyncio.sleep(0)
+            first.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await first
+            release.set()
+            return await second
+
+        self.assertEqual(self.run_requests(run())[0].status_code, 200)
+        self.assertEqual(len(self.requests), 1)
+
+    @override_settings(OJS_GATEWAY_MAX_CONCURRENCY=2)
+    def test_queue(self):
+        active = []
+        most_active = []
+
+        async def handler(request):
+            active.append(request)
+            most_active.append(len(active))
+            await asyncio.sleep(0.02)
+            active.remove(request)
+            return Response(200)
+
+        self.handler = handler
+        self.run_requests(
+            *(
+                helpers.send_async(Request("GET", f"http://ojs/{index}"))
+                for index in range(5)
+            )
+        )
+        self.assertEqual(len(self.requests), 5)
+        self.assertEqual(max(most_active), 2)
+        stats = gateway.get_queue_stats()[0]
+        self.assertEqual(stats["host"], "http://ojs")
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["waiting"], 0)
+        self.assertGreaterEqual(stats["max_wait"], 0.03)
+
+
+class GetJournalsTest(MockOJSTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def get_journals(self, pooled=True):
+        async def run():
+            try:
+                return await helpers.get_journals(
+                    "http://ojs", "KEY", pooled=pooled
+                )
+            finally:
+                self.pooled_clients = dict(
+                    gateway._clients.get(asyncio.get_running_loop(), {})
+                )
+                await gateway.aclose_clients()
+
+        return asyncio.run(run())
+
+    def serve(self, body, etag):
+        def handler(request):
+            if request.headers.get("If-None-Match") == etag:
+                return Response(304)
+            return Response(200, content=body, headers={"ETag": etag})
+
+        self.handler = handler
+
+    def test_cache(self):
+        self.serve(b"[1]", '"1"')
+        self.assertEqual(self.get_journals(), b"[1]")
+        self.assertEqual(self.get_journals(), b"[1]")
+        self.assertEqual(len(self.requests), 1)
+        with override_settings(OJS_JOURNALS_CACHE_TTL=0):
+            # The list is revalidated with its ETag.
+            self.assertEqual(self.get_journals(), b"[1]")
+            self.assertEqual(self.requests[1].headers["If-None-Match"], '"1"')
+            self.serve(b"[1, 2]", '"2"')
+            self.assertEqual(self.get_journals(), b"[1, 2]")
+        self.assertEqual(self.get_journals(), b"[1, 2]")
+        self.assertEqual(len(self.requests), 3)
+
+    @override_settings(OJS_JOURNALS_CACHE_TTL=0)
+    def test_unavailable(self):
+        self.serve(b"[1]", '"1"')
+        self.get_journals()
+        # The last known list is used while OJS cannot be reached.
+        self.handler = lambda request: Response(503)
+        self.assertEqual(self.get_journals(), b"[1]")
+
+        def handler(request):
+            raise ConnectError("Refused")
+
+        self.handler = handler
+        self.assertEqual(self.get_journals(), b"[1]")
+        with override_settings(OJS_CIRCUIT_FAILURE_THRESHOLD=1):
+            gateway.get_breaker("http://ojs").record_failure("Refused")
+            requests = len(self.requests)
+            self.assertEqual(self.get_journals(), b"[1]")
+            self.assertEqual(len(self.requests), requests)
+
+    def test_client_error(self):
+        self.handler = lambda request: Response(403)
+        with self.assertRaises(HTTPStatusError):
+            self.get_journals()
+        self.handler = lambda request: Response(503)
+        with self.assertRaises(HTTPStatusError):
+            self.get_journals()
+        # A wrong key is reported even if there is a list from before.
+        self.serve(b"[1]", '"1"')
+        self.get_journals()
+        self.handler = lambda request: Response(403)
+        with override_settings(OJS_JOURNALS_CACHE_TTL=0):
+            with self.assertRaises(HTTPStatusError):
+                self.get_journals()
+
+    def test_unpooled(self):
+        self.serve(b"[1]", '"1"')
+        self.assertEqual(self.get_journals(pooled=False), b"[1]")
+        self.assertEqual(len(self.requests), 1)
+        # The host gets no client, circuit breaker or queue of its own.
+        self.assertEqual(self.pooled_clients, {})
+        self.assertEqual(gateway.get_breaker_states(), [])
+        self.assertEqual(gateway.get_queue_stats(), [])
+        with override_settings(OJS_JOURNALS_CACHE_TTL=0):
+            self.assertEqual(self.get_journals(), b"[1]")
+        self.assertEqual(list(self.pooled_clients), ["http://ojs"])
+
+
+class JournalHostTest(TestCase):
+    def test_is_journal_host(self):
+        models.Journal.objects.create(
+            ojs_url="http://ojs/index.php",
+            ojs_key="KEY",
+            ojs_jid=1,
+            name="Journal",
+            editor=get_user_model().objects.create_user(
+                "editor", "editor@x.com"
+            ),
+        )
+        for url, registered in (
+            ("http://ojs/other", True),
+            ("http://ojs", True),
+            ("http://ojs.example.org", False),
+            ("http://ojs:8080/index.php", False),
+            ("https://ojs/index.php", False),
+        ):
+            self.assertEqual(
+                async_to_sync(helpers.is_journal_host)(url), registered
+            )
@@ -0,0 +1,309 @@
+import json
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from document.models import Document, DocumentTemplate
+from usermedia.models import DocumentImage, Image
+
+from ojs import helpers
+from ojs import models
+
+
+class ShrinkDocTest(SimpleTestCase):
+    def test_shrink_doc(self):
+        content = {
+            "type": "doc",
+            "content": [
+                {"type": "title", "content": [{"type": "text", "text": "T"}]},
+                {
+                    "type": "richtext_part",
+                    "content": [
+                        {
+                            "type": "paragraph",
+                            "content": [
+                                {
+                                    "type": "citation",
+                                    "attrs": {"references": [{"id": 2}]},
+                                },
+                                {
+                                    "type": "footnote",
+                                    "attrs": {
+                                        "footnote": [
+                                            {
+                                                "type": "paragraph",
+                                                "content": [
+                                                    {
+                                                        "type": "citation",
+                                                        "attrs": {
+                                                            "references": [
+                                                                {"id": 5},
+                                                                {"id": 2},
+                                                            ]
+                                                        },
+                                                    }
+                                                ],
+                                            }
+                                        ]
+                                    },
+                                },
+                            ],
+                        },
+                        {
+                            "type": "figure",
+                            "content": [
+                                {"type": "image", "attrs": {"image": 7}},
+                                {"type": "image", "attrs": {"image": False}},
+                            ],
+                        },
+                        {
+                            "type": "figure",
+                            "content": [
+                                {"type": "image", "attrs": {"image": 3}},
+                                {"type": "image", "attrs": {"image": 7}},
+                            ],
+                        },
+                    ],
+                },
+            ],
+        }
+        document = SimpleNamespace(
+            content=content,
+            bibliography={
+                "2": {"bib_type": "article", "cats": [1], "fields": {}},
+                "5": {"bib_type": "book", "fields": {}},
+                "9": {"bib_type": "book", "fields": {}},
+            },
+        )
+        shrunk_content, bibliography, image_ids = helpers.shrink_doc(document)
+        self.assertIs(shrunk_content, content)
+        self.assertEqual(
+            bibliography,
+            {
+                "2": {"bib_type": "article", "fields": {}},
+                "5": {"bib_type": "book", "fields": {}},
+            },
+        )
+        self.assertEqual(list(bibliography), ["2", "5"])
+        self.assertEqual(image_ids, [7, 3])
+        # The stored bibliography is not changed.
+        self.assertEqual(document.bibliography["2"]["cats"], [1])
+
+
+class PlaceholderImageTest(TestCase):
+    fixtures = ["initial_documenttemplates.json", "initial_styles.json"]
+
+    def setUp(self):
+        self.template = DocumentTemplate.objects.first()
+
+    def create_doc(self, owner, images):
+        return helpers.create_doc(
+            owner,
+            self.template,
+            "Title",
+            {"type": "doc", "content": []},
+            {},
+            images,
+            {},
+            1,
+            "1.0.0",
+        )
+
+    def test_placeholder_image(self):
+        owner = get_user_model().objects.create_user("owner", "owner@x.com")
+        document = self.create_doc(owner, [None, None])
+        placeholder = Image.objects.get(uploader=owner)
+        self.assertEqual(
+            list(document.documentimage_set.values_list("image", flat=True)),
+            [placeholder.id],
+        )
+        # The document, the placeholder looked up once and the images.
+        with self.assertNumQueries(3):
+            document = self.create_doc(owner, [None, None])
+        self.assertEqual(Image.objects.count(), 1)
+        self.assertEqual(document.documentimage_set.get().image, placeholder)
+        # A deleted placeholder is created again.
+        placeholder.delete()
+        document = self.create_doc(owner, [None])
+        placeholder = Image.objects.get(uploader=owner)
+        self.assertEqual(placeholder.checksum, helpers.PLACEHOLDER_CHECKSUM)
+        self.assertEqual(document.documentimage_set.get().image, placeholder)
+
+
+class CopyRevisionTest(TestCase):
+    fixtures = ["initial_documenttemplates.json", "initial_styles.json"]
+
+    def setUp(self):
+        User = get_user_model()
+        self.editor = User.objects.create_user("editor", "editor@x.com")
+        journal = models.Journal.objects.create(
+            ojs_url="http://localhost:1",
+            ojs_key="OJS_KEY",
+            ojs_jid=5,
+            name="Journal",
+            editor=self.editor,
+        )
+        self.submission = models.Submission.objects.create(
+            submitter=self.editor, journal=journal, ojs_jid=15
+        )
+        self.content = {
+            "type": "doc",
+            "content": [
+                {"type": "title", "content": [{"type": "text", "text": "T"}]},
+                {
+                    "type": "contributors_part",
+                    "attrs": {"id": "authors", "title": "Authors"},
+                    "content": [
+                        {"type": "contributor", "attrs": {"firstname": "A"}},
+                        {"type": "contributor", "attrs": {"firstname": "B"}},
+                    ],
+                },
+                {
+                    "type": "contributors_part",
+                    "attrs": {"id": "editors"},
+                    "content": [
+                        {"type": "contributor", "attrs": {"firstname": "C"}}
+                    ],
+                },
+                {"type": "contributors_part", "attrs": {"id": "empty"}},
+                {
+                    "type": "richtext_part",
+                    "attrs": {"id": "body"},
+                    "content": [{"type": "paragraph"}],
+                },
+            ],
+        }
+        self.images = Image.objects.bulk_create(
+            [
+                Image(uploader=self.editor, image=f"image{index}.png")
+                for index in range(3)
+            ]
+        )
+
+    def create_revision(self, version, content, contributors):
+        document = Document.objects.create(
+            owner=self.editor,
+            template=DocumentTemplate.objects.first(),
+            title="A/B",
+            content=content,
+            bibliography={"1": {"bib_type": "article", "fields": {}}},
+            comments={"5": {"comment": "Nice"}},
+            path=f"/Submission {self.submission.id}/AB ({version})",
+        )
+        DocumentImage.objects.bulk_create(
+            [
+                DocumentImage(document=document, image=image, title="Figure")
+                for image in self.images
+            ]
+        )
+        return models.SubmissionRevision.objects.create(
+            submission=self.submission,
+            version=version,
+            document=document,
+            contributors=contributors,
+        )
+
+    def get_revision(self, revision_id):
+        return models.SubmissionRevision.objects.select_related(
+            "submission__journal__editor", "document__template"
+        ).get(id=revision_id)
+
+    def get_copy_state(self, document, contributors):
+        document = Document.objects.get(id=document.id)
+        state = {
+            "contributors": contributors,
+            "images": sorted(
+                document.documentimage_set.values_list(
+                    "image_id", "title", "copyright"
+                )
+            ),
+        }
+        for field in Document._meta.concrete_fields:
+            if field.name not in ("id", "added", "updated"):
+                state[field.name] = getattr(document, field.attname)
+        return state
+
+    def copy(self, copy_function, source, old_stage, new_stage, new_version):
+        document, contributors = copy_function(
+            self.get_revision(source.id), old_stage, new_stage, new_version
+        )
+        return self.get_copy_state(document, contributors)
+
+    def check_copies(self, source, old_stage, new_stage, new_version):
+        python_copy = self.copy(
+            helpers.copy_revision_in_python,
+            source,
+            old_stage,
+            new_stage,
+            new_version,
+        )
+        if connection.vendor == "postgresql":
+            db_copy = self.copy(
+                helpers.copy_revision_in_db,
+                source,
+                old_stage,
+                new_stage,
+                new_version,
+            )
+            self.assertEqual(python_copy, db_copy)
+        # The source is not changed.
+        self.assertEqual(
+            Document.objects.get(id=source.document_id).content,
+            source.document.content,
+        )
+        return python_copy
+
+    def test_start_review(self):
+        source = self.create_revision("1.0.0", self.content, {})
+        copy = self.check_copies(source, 1, 3, "3.0.0")
+        self.assertEqual(
+            copy["contributors"],
+            {
+                "authors": self.content["content"][1]["content"],
+                "editors": self.content["content"][2]["content"],
+            },
+        )
+        self.assertEqual(copy["content"]["content"][1]["content"], [])
+        self.assertEqual(copy["content"]["content"][2]["content"], [])
+        self.assertNotIn("content", copy["content"]["content"][3])
+        self.assertEqual(
+            copy["content"]["content"][4], self.content["content"][4]
+        )
+        self.assertEqual(
+            copy["path"], f"/Submission {self.submission.id}/AB (3.0.0)"
+        )
+        self.assertEqual(copy["owner"], self.editor.id)
+        self.assertEqual(len(copy["images"]), 3)
+
+    def test_end_review(self):
+        content = json.loads(json.dumps(self.content))
+        contributors = {
+            "authors": content["content"][1].pop("content"),
+            "empty": [{"type": "contributor", "attrs": {"firstname": "D"}}],
+        }
+        source = self.create_revision("3.0.5", content, contributors)
+        copy = self.check_copies(source, 3, 4, "4.0.0")
+        self.assertEqual(copy["contributors"], {})
+        self.assertEqual(
+            copy["content"]["content"][1]["content"],
+            self.content["content"][1]["content"],
+        )
+        self.assertEqual(
+            copy["content"]["content"][3]["content"],
+            contributors["empty"],
+        )
+
+    def test_within_review(self):
+        contributors = {"authors": []}
+        source = self.create_revision("3.0.0", self.content, contributors)
+        copy = self.check_copies(source, 3, 3, "3.0.5")
+        self.assertEqual(copy["contributors"], contributors)
+        self.assertEqual(copy["content"], self.content)
+
+    def test_unexpected_content(self):
+        source = self.create_revision("1.0.0", {"type": "doc"}, {})
+        copy = self.check_copies(source, 1, 3, "3.0.0")
+        self.assertEqual(copy["content"], {"type": "doc"})
+        self.assertEqual(copy["contributors"], {})
@@ -0,0 +1,208 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from document.consumers import WebsocketConsumer
+from document.models import AccessRight, Document, DocumentTemplate
+
+from ojs import delta
+from ojs import helpers
+from ojs import history
+from ojs import models
+
+
+def make_content(paragraphs):
+    return {
+        "type": "doc",
+        "content": [
+            {"type": "title", "content": [{"type": "text", "text": "Title"}]},
+            {
+                "type": "richtext_part",
+                "attrs": {"id": "body"},
+                "content": [
+                    {
+                        "type": "paragraph",
+                        "content": [{"type": "text", "text": text}],
+                    }
+                    for text in paragraphs
+                ],
+            },
+        ],
+    }
+
+
+class DeltaTest(SimpleTestCase):
+    def test_patch(self):
+        paragraphs = [f"Paragraph {index}" for index in range(50)]
+        changed = list(paragraphs)
+        changed[10] = "Changed"
+        del changed[20:22]
+        changed.insert(30, "Inserted")
+        for old, new in (
+            (make_content(paragraphs), make_content(changed)),
+            (make_content(paragraphs), make_content(paragraphs)),
+            (make_content(paragraphs), {"type": "doc"}),
+            ({"1": {"a": 1}, "2": [1, 2]}, {"2": [2, 1, 3], "3": None}),
+            ([1, {"a": 1}, [2]], [{"a": 2}, [3], 4]),
+            ({}, []),
+            ("text", {"a": 1}),
+        ):
+            self.assertEqual(delta.patch(old, delta.diff(old, new)), new)
+
+    def test_small_changes(self):
+        paragraphs = [f"Paragraph {index}" for index in range(500)]
+        changed = list(paragraphs)
+        changed[100] = "Changed"
+        content = make_content(changed)
+        diff = delta.diff(make_content(paragraphs), content)
+        self.assertLess(len(delta.dumps(diff)), 300)
+        self.assertEqual(delta.patch(make_content(paragraphs), diff), content)
+
+
+class CompactionTest(TestCase):
+    fixtures = ["initial_documenttemplates.json", "initial_styles.json"]
+
+    def setUp(self):
+        User = get_user_model()
+        self.editor = User.objects.create_user("editor", "editor@x.com")
+        journal = models.Journal.objects.create(
+            ojs_url="http://localhost:1",
+            ojs_key="OJS_KEY",
+            ojs_jid=5,
+            name="Journal",
+            editor=self.editor,
+        )
+        self.submission = models.Submission.objects.create(
+            submitter=self.editor, journal=journal, ojs_jid=15
+        )
+        self.template = DocumentTemplate.objects.first()
+        paragraphs = [f"Paragraph {index}" for index in range(100)]
+        self.documents = {}
+        self.fields = {}
+        for version in ("1.0.0", "3.0.0", "3.0.5", "4.0.0"):
+            paragraphs = paragraphs + [f"Added in {version}"]
+            fields = {
+                "content": make_content(paragraphs),
+                "bibliography": {"1": {"bib_type": "book", "fields": {}}},
+                "comments": {"5": {"comment": f"Comment on {version}"}},
+            }
+            document = Document.objects.create(
+                owner=self.editor,
+                template=self.template,
+                title="Title",
+                **fields,
+            )
+            models.SubmissionRevision.objects.create(
+                submission=self.submission, version=version, document=document
+            )
+            self.documents[version] = document
+            self.fields[version] = fields
+        self.reader = User.objects.create_user("reader", "reader@x.com")
+        AccessRight.objects.create(
+            document=self.documents["3.0.0"],
+            holder_obj=self.reader,
+            path=self.documents["3.0.0"].path,
+            rights="read",
+        )
+
+    def get_revision(self, version):
+        return models.SubmissionRevision.objects.get(
+            submission=self.submission, version=version
+        )
+
+    def assertMaterialized(self, version, fields):
+        revision = helpers.materialize_revision(self.get_revision(version).id)
+        document = revision.document
+        for field, value in fields.items():
+            self.assertEqual(getattr(document, field), value)
+        self.assertEqual(document.title, "Title")
+        self.assertEqual(document.template, self.template)
+        return document
+
+    def test_compact_submission(self):
+        self.assertEqual(history.compact_submission(self.submission.id), 2)
+        self.assertEqual(history.compact_submission(self.submission.id), 0)
+        for version, compacted in (
+            ("1.0.0", False),
+            ("3.0.0", True),
+            ("3.0.5", True),
+            ("4.0.0", False),
+        ):
+            self.assertEqual(
+                self.get_revision(version).document_id is None, compacted
+            )
+            self.assertEqual(
+                Document.objects.filter(
+                    id=self.documents[version].id
+                ).exists(),
+                not compacted,
+            )
+        self.assertEqual(
+            self.get_revision("3.0.0").pending_rights,
+            {str(self.reader.id): "read"},
+        )
+        # Only the first compacted revision is stored in full.
+        self.assertIsNone(
+            models.CompactedRevision.objects.get(
+                revision=self.get_revision("3.0.0")
+            ).base
+        )
+        self.assertEqual(
+            models.CompactedRevision.objects.get(
+                revision=self.get_revision("3.0.5")
+            ).base_id,
+            self.get_revision("3.0.0").id,
+        )
+
+    def test_materialize_compacted_revision(self):
+        history.compact_submission(self.submission.id)
+        document = self.assertMaterialized("3.0.0", self.fields["3.0.0"])
+        self.assertEqual(
+            AccessRight.objects.get(document=document).holder_id,
+            self.reader.id,
+        )
+        self.assertMaterialized("3.0.5", self.fields["3.0.5"])
+        # The revisions keep their documents.
+        self.assertMaterialized("3.0.0", self.fields["3.0.0"])
+
+    def test_compact_changed_revision(self):
+        history.compact_submission(self.submission.id)
+        # 3.0.5 is based on 3.0.0.
+        document = helpers.materialize_revision(
+            self.get_revision("3.0.0").id
+        ).document
+        document.content = make_content(["Rewritten"])
+        document.save()
+        self.assertEqual(history.compact_submission(self.submission.id), 1)
+        self.assertMaterialized(
+            "3.0.0",
+            dict(self.fields["3.0.0"], content=make_content(["Rewritten"])),
+        )
+        self.assertMaterialized("3.0.5", self.fields["3.0.5"])
+
+    def test_open_document(self):
+        document_id = self.documents["3.0.0"].id
+        WebsocketConsumer.sessions[document_id] = {"participants": {}}
+        try:
+            self.assertEqual(history.compact_submission(self.submission.id), 1)
+        finally:
+            del WebsocketConsumer.sessions[document_id]
+        self.assertEqual(self.get_revision("3.0.0").document_id, document_id)
+        self.assertMaterialized("3.0.5", self.fields["3.0.5"])
+
+    def test_copy_compacted_revision(self):
+        history.compact_submission(self.submission.id)
+        revision = helpers.materialize_revision(self.get_revision("3.0.5").id)
+        copy = helpers.copy_revision(revision, 3, 3, "3.1.0")
+        self.assertEqual(
+            Document.objects.get(id=copy.document_id).content,
+            self.fields["3.0.5"]["content"],
+        )
+
+    def test_command(self):
+        out = StringIO()
+        call_command("ojs_compact_revisions", stdout=out)
+        self.assertEqual(out.getvalue(), "Compacted 2 revision documents.\n")
+        self.assertMaterialized("3.0.0", self.fields["3.0.0"])
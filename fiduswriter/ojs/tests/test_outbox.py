@@ -0,0 +1,175 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import AsyncMock, patch
+
+from asgiref.sync import async_to_sync
+from httpx import ConnectError, HTTPStatusError, InvalidURL, Request, Response
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from django.test import TestCase
+from django.utils import timezone
+
+from ojs import gateway
+from ojs import helpers
+from ojs import models
+from ojs import outbox
+from ojs.admin import OutboxMessageAdmin
+from ojs.management.commands.ojs_outbox_worker import Command
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        editor = get_user_model().objects.create_user("editor", "editor@x.com")
+        self.journals = [
+            models.Journal.objects.create(
+                ojs_url=ojs_url,
+                ojs_key="OJS_KEY",
+                ojs_jid=ojs_jid,
+                name="Journal",
+                editor=editor,
+            )
+            for ojs_url, ojs_jid in (
+                ("http://ojs-a", 1),
+                ("http://ojs-a", 2),
+                ("http://ojs-b", 1),
+            )
+        ]
+
+    def enqueue(self, journal, **fields):
+        message = outbox.enqueue(journal, "reviewerSubmit", {})
+        models.OutboxMessage.objects.filter(id=message.id).update(**fields)
+        return message
+
+    def claim(self, limit=10):
+        return [message.id for message in outbox.claim(limit)]
+
+    def get_message(self, message):
+        return models.OutboxMessage.objects.get(id=message.id)
+
+    def test_claim(self):
+        # The two journals at ojs-a share one server.
+        first = self.enqueue(self.journals[1])
+        second = self.enqueue(self.journals[0])
+        other = self.enqueue(self.journals[2])
+        self.assertEqual(self.claim(), [first.id, other.id])
+        self.assertIsNotNone(self.get_message(first).locked_until)
+        # Claimed messages hold back the later messages of their server.
+        self.assertEqual(self.claim(), [])
+        models.OutboxMessage.objects.filter(id=first.id).update(
+            state="delivered", locked_until=None
+        )
+        self.assertEqual(self.claim(), [second.id])
+
+    def test_claim_due(self):
+        now = timezone.now()
+        waiting = self.enqueue(
+            self.journals[0], next_attempt=now + timedelta(minutes=1)
+        )
+        self.enqueue(self.journals[0])
+        expired = self.enqueue(
+            self.journals[2], locked_until=now - timedelta(minutes=1)
+        )
+        self.assertEqual(self.claim(), [expired.id])
+        models.OutboxMessage.objects.filter(id=waiting.id).update(
+            next_attempt=now
+        )
+        self.assertEqual(self.claim(1), [waiting.id])
+
+    def deliver(self, error):
+        message = outbox.claim(1)[0]
+        with patch.object(
+            helpers, "send_async", AsyncMock(side_effect=error)
+        ), self.assertLogs("ojs.outbox", "WARNING"):
+            async_to_sync(outbox.deliver)(message)
+        return self.get_message(message)
+
+    def test_backoff(self):
+        self.enqueue(self.journals[0])
+        before = timezone.now()
+        for attempts in (1, 2):
+            message = self.deliver(ConnectError("Refused"))
+            self.assertEqual(message.state, "pending")
+            self.assertEqual(message.attempts, attempts)
+            self.assertIsNone(message.locked_until)
+            self.assertEqual(message.last_error, "Refused")
+            self.assertGreaterEqual(
+                message.next_attempt,
+                before + timedelta(seconds=2**attempts * 5),
+            )
+            models.OutboxMessage.objects.filter(id=message.id).update(
+                next_attempt=timezone.now()
+            )
+        # OJS has not been contacted, so this is not counted as an attempt.
+        message = self.deliver(gateway.CircuitOpenError("Open"))
+        self.assertEqual(message.state, "pending")
+        self.assertEqual(message.attempts, 2)
+
+    def test_dead_letter(self):
+        request = Request("POST", "http://ojs-a")
+        self.enqueue(self.journals[0], attempts=9)
+        message = self.deliver(ConnectError("Refused"))
+        self.assertEqual(message.state, "failed")
+        self.assertEqual(message.attempts, 10)
+        for error in (
+            HTTPStatusError(
+                "Forbidden", request=request, response=Response(403)
+            ),
+            InvalidURL("Invalid URL"),
+            ValueError("Broken journal"),
+        ):
+            self.enqueue(self.journals[0])
+            message = self.deliver(error)
+            self.assertEqual(message.state, "failed")
+            self.assertEqual(message.attempts, 1)
+
+    def test_requeue(self):
+        failed = self.enqueue(self.journals[0], state="failed", attempts=10)
+        received = self.enqueue(
+            self.journals[0],
+            state="failed",
+            attempts=1,
+            delivered=timezone.now(),
+        )
+        delivered = self.enqueue(
+            self.journals[0], state="delivered", delivered=timezone.now()
+        )
+        OutboxMessageAdmin(models.OutboxMessage, admin.site).requeue(
+            None, models.OutboxMessage.objects.all()
+        )
+        message = self.get_message(failed)
+        self.assertEqual(message.state, "pending")
+        self.assertEqual(message.attempts, 0)
+        # OJS has received these messages already.
+        self.assertEqual(self.get_message(received).state, "failed")
+        self.assertEqual(self.get_message(delivered).state, "delivered")
+
+    def run_worker(self):
+        command = Command(stdout=StringIO())
+        async_to_sync(command.run)(
+            {"concurrency": 10, "once": True, "interval": 0}
+        )
+
+    def test_worker(self):
+        message = self.enqueue(self.journals[0])
+        with patch.object(
+            helpers,
+            "send_async",
+            AsyncMock(return_value=Response(200, content=b"{}")),
+        ), patch.object(
+            outbox,
+            "mark_delivered",
+            AsyncMock(side_effect=DatabaseError("Gone")),
+        ), self.assertLogs(
+            "ojs.outbox", "ERROR"
+        ):
+            self.run_worker()
+        # The message is retried when its lease has expired.
+        self.assertEqual(self.get_message(message).state, "pending")
+        with patch.object(
+            outbox, "deliver_due", AsyncMock(side_effect=DatabaseError("Gone"))
+        ), self.assertLogs(
+            "ojs.management.commands.ojs_outbox_worker", "ERROR"
+        ):
+            self.run_worker()
@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from document.consumers import WebsocketConsumer
+from document.models import AccessRight, Document, DocumentTemplate
+
+from ojs import credentials
+from ojs import models
+from ojs import push
+
+
+# A connection of a user to an open document, as kept by the document
+# consumer.
+class Participant:
+    def __init__(self, user, access_rights, is_owner=False):
+        self.user = user
+        self.user_info = SimpleNamespace(
+            access_rights=access_rights, is_owner=is_owner
+        )
+        self.messages = []
+        self.denied = False
+
+    def send_message(self, message):
+        self.messages.append(message)
+
+    def access_denied(self):
+        self.denied = True
+
+
+class PushTest(TestCase):
+    fixtures = ["initial_documenttemplates.json", "initial_styles.json"]
+
+    def setUp(self):
+        cache.clear()
+        credentials.local_cache.clear()
+        User = get_user_model()
+        self.users = [
+            User.objects.create_user(f"user{index}", f"user{index}@x.com")
+            for index in range(3)
+        ]
+        self.document = Document.objects.create(
+            owner=self.users[2],
+            template=DocumentTemplate.objects.first(),
+            title="Title",
+            content={"type": "doc", "content": []},
+        )
+        self.participants = [
+            Participant(self.users[0], "write"),
+            Participant(self.users[1], "comment"),
+            Participant(self.users[2], "write", is_owner=True),
+        ]
+        WebsocketConsumer.sessions[self.document.id] = {
+            "participants": dict(enumerate(self.participants))
+        }
+
+    def tearDown(self):
+        WebsocketConsumer.sessions.pop(self.document.id, None)
+
+    def test_push_rights(self):
+        user_ids = [user.id for user in self.users]
+        push.push_rights_changes(
+            {
+                self.document.id: dict(zip(user_ids, ["read", None, None])),
+                # The document is not open in this process.
+                self.document.id + 1: {user_ids[0]: "write"},
+            }
+        )
+        first, second, owner = self.participants
+        self.assertEqual(
+            first.messages,
+            [
+                {"type": "access_right", "access_right": "read"},
+                {"type": "ojs_submission"},
+            ],
+        )
+        self.assertEqual(first.user_info.access_rights, "read")
+        self.assertTrue(second.denied)
+        self.assertEqual(second.messages, [])
+        # The owner keeps access.
+        self.assertFalse(owner.denied)
+        self.assertEqual(owner.messages, [])
+
+    def test_push_submission_change(self):
+        push.push_submission_change(self.document.id, "4.0.0")
+        for participant in self.participants:
+            self.assertEqual(
+                participant.messages,
+                [{"type": "ojs_submission", "new_version": "4.0.0"}],
+            )
+
+    def test_remove_author(self):
+        submission = models.Submission.objects.create(
+            submitter=self.users[2],
+            journal=models.Journal.objects.create(
+                ojs_url="http://localhost:1",
+                ojs_key="OJS_KEY",
+                ojs_jid=5,
+                name="Journal",
+                editor=self.users[2],
+            ),
+        )
+        models.SubmissionRevision.objects.create(
+            submission=submission, version="1.0.0", document=self.document
+        )
+        models.Author.objects.create(
+            user=self.users[0], submission=submission, ojs_jid=7
+        )
+        AccessRight.objects.create(
+            document=self.document,
+            holder_obj=self.users[0],
+            path=self.document.path,
+            rights="write",
+        )
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(
+                f"/api/ojs/remove_author/{submission.id}/",
+                {"key": "OJS_KEY", "user_id": 7},
+            )
+            self.assertEqual(response.status_code, 200)
+            # Nothing is pushed before the change has been committed.
+            self.assertFalse(self.participants[0].denied)
+        self.assertEqual(len(callbacks), 1)
+        self.assertTrue(self.participants[0].denied)
+        self.assertFalse(self.participants[1].denied)
@@ -0,0 +1,643 @@
+import json
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from document.models import AccessRight, Document, DocumentTemplate
+from usermedia.models import DocumentImage, Image
+
+from ojs import credentials
+from ojs import membership
+from ojs import models
+from ojs import token
+
+
+# The number of queries needed by the calls from OJS should not depend on the
+# number of revisions of a submission.
+class MembershipQueriesTest(TestCase):
+    fixtures = ["initial_documenttemplates.json", "initial_styles.json"]
+
+    def setUp(self):
+        cache.clear()
+        credentials.local_cache.clear()
+        User = get_user_model()
+        # Fill the content type cache.
+        ContentType.objects.get_for_model(User)
+        self.editor = User.objects.create_user("editor", "editor@x.com")
+        self.template = DocumentTemplate.objects.first()
+        self.journal = models.Journal.objects.create(
+            ojs_url="http://localhost:1",
+            ojs_key="OJS_KEY",
+            ojs_jid=5,
+            name="Journal",
+            editor=self.editor,
+        )
+
+    def create_submission(self, versions):
+        submission = models.Submission.objects.create(
+            submitter=self.editor, journal=self.journal, ojs_jid=15
+        )
+        for version in versions:
+            document = Document.objects.create(
+                owner=self.editor,
+                template=self.template,
+                title="Title",
+                content={"type": "doc", "content": []},
+                path=f"/Submission {submission.id}/Title ({version})",
+            )
+            models.SubmissionRevision.objects.create(
+                submission=submission, version=version, document=document
+            )
+        return submission
+
+    def count_queries(self, url, data, status):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, dict(data, key="OJS_KEY"))
+        self.assertEqual(response.status_code, status, response.content)
+        return len(context.captured_queries)
+
+    def count_membership_queries(self, versions):
+        submission = self.create_submission(versions)
+        # Fill the credentials cache.
+        credentials.get_submission_credentials(submission.id)
+        counts = []
+        for user_type, extra in (
+            ("editor", {"role": 16, "stage_ids": "1,3,4"}),
+            ("author", {}),
+        ):
+            params = dict(
+                extra,
+                user_id=7,
+                email=f"{user_type}{len(versions)}@ojs.org",
+                username=f"{user_type}{len(versions)}",
+            )
+            counts.append(
+                self.count_queries(
+                    f"/api/ojs/add_{user_type}/{submission.id}/", params, 201
+                )
+            )
+            counts.append(
+                self.count_queries(
+                    f"/api/ojs/add_{user_type}/{submission.id}/", params, 200
+                )
+            )
+            counts.append(
+                self.count_queries(
+                    f"/api/ojs/remove_{user_type}/{submission.id}/",
+                    {"user_id": 7},
+                    200,
+                )
+            )
+        self.assertFalse(
+            AccessRight.objects.filter(
+                document__submissionrevision__submission=submission,
+                user__email__endswith="@ojs.org",
+            ).exists()
+        )
+        return counts
+
+    def test_membership_queries(self):
+        few = self.count_membership_queries(["1.0.0", "3.0.0"])
+        many = self.count_membership_queries(
+            ["1.0.0", "3.0.0", "3.0.5", "3.1.0", "3.1.5", "4.0.0", "4.0.5"]
+        )
+        self.assertEqual(few, many)
+
+    def test_concurrent_add(self):
+        submission = self.create_submission(["1.0.0"])
+        revision = submission.submissionrevision_set.get()
+        context = membership.SubmissionContext(submission.id)
+        # The context is loaded before another request for the same author
+        # has been committed.
+        self.assertEqual(context.authors, {})
+        self.assertEqual(context.rights, {})
+        user = get_user_model().objects.create_user("author", "author@ojs.org")
+        author = models.Author.objects.create(
+            user=user, submission=submission, ojs_jid=7
+        )
+        AccessRight.objects.create(
+            document=revision.document,
+            holder_obj=user,
+            path=revision.document.path,
+            rights="read-without-comments",
+        )
+        status, response = membership.add_author(
+            context,
+            {"user_id": 7, "email": "author@ojs.org", "username": "author"},
+        )
+        context.save()
+        self.assertEqual(status, 201)
+        self.assertEqual(context.authors[7].pk, author.pk)
+        self.assertEqual(
+            models.Author.objects.get(submission=submission).user, user
+        )
+        self.assertEqual(
+            AccessRight.objects.get(document=revision.document).holder_id,
+            user.id,
+        )
+
+    def test_batch(self):
+        submission = self.create_submission(["1.0.0", "3.0.0"])
+        author = {"user_id": 7, "email": "author@ojs.org", "username": "a"}
+        editor = {
+            "user_id": 8,
+            "email": "editor@ojs.org",
+            "username": "e",
+            "role": 16,
+        }
+        operations = [
+            dict(author, operation="add_author"),
+            # Fails after the user and the editor have been added.
+            dict(editor, operation="add_editor"),
+            dict(author, operation="add_reviewer", version="2.0.0"),
+            # The editor added by the failed operation is gone.
+            dict(editor, operation="add_editor", stage_ids=""),
+            dict(editor, operation="add_editor", stage_ids="1,3"),
+            {"operation": "remove_reviewer", "user_id": 7, "version": "1.0.0"},
+            dict(editor, operation="add_editor", user_id=9, email="9@ojs.org"),
+            {"operation": "unknown"},
+        ]
+        response = self.client.post(
+            f"/api/ojs/batch/{submission.id}/",
+            {"key": "OJS_KEY", "operations": json.dumps(operations)},
+        )
+        self.assertEqual(
+            [result["status"] for result in response.json()["results"]],
+            [201, 400, 404, 201, 201, 403, 400, 400],
+        )
+        self.assertEqual(
+            list(
+                models.Editor.objects.filter(
+                    submission=submission
+                ).values_list("ojs_jid", flat=True)
+            ),
+            [8],
+        )
+        self.assertEqual(
+            sorted(
+                get_user_model()
+                .objects.filter(email__endswith="@ojs.org")
+                .values_list("email", flat=True)
+            ),
+            ["author@ojs.org", "editor@ojs.org"],
+        )
+        self.assertEqual(
+            sorted(
+                AccessRight.objects.filter(
+                    document__submissionrevision__submission=submission,
+                    user__email__endswith="@ojs.org",
+                ).values_list("user__email", "rights")
+            ),
+            [
+                ("author@ojs.org", "read-without-comments"),
+                ("editor@ojs.org", "write"),
+                ("editor@ojs.org", "write"),
+            ],
+        )
+
+    def test_find_member(self):
+        submission = self.create_submission(["1.0.0", "3.0.0"])
+        revision = submission.submissionrevision_set.get(version="3.0.0")
+        User = get_user_model()
+        author = User.objects.create_user("author", "author@x.com")
+        reviewer = User.objects.create_user("reviewer", "reviewer@x.com")
+        editor = User.objects.create_user("editor2", "editor2@x.com")
+        models.Author.objects.create(
+            user=author, submission=submission, ojs_jid=1
+        )
+        models.Reviewer.objects.create(
+            user=reviewer, revision=revision, ojs_jid=2
+        )
+        models.Editor.objects.create(
+            user=editor, submission=submission, ojs_jid=3, role=16
+        )
+        # An OJS user who is both author and editor logs in as author.
+        models.Editor.objects.create(
+            user=editor, submission=submission, ojs_jid=1, role=16
+        )
+        for args, expected in (
+            ((1, True), (author, "author")),
+            ((2, True), (reviewer, "reviewer")),
+            ((3, True), (editor, "editor")),
+            ((3, False), (None, None)),
+            ((4, True), (None, None)),
+        ):
+            with self.assertNumQueries(1):
+                self.assertEqual(
+                    membership.find_member(submission.id, "3.0.0", *args),
+                    expected,
+                )
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                membership.find_member(submission.id, "1.0.0", 2, True),
+                (None, None),
+            )
+
+    def test_version_parts(self):
+        submission = self.create_submission(["1.0.0", "3.10.5", "3.9.0"])
+        revisions = submission.submissionrevision_set.order_by(
+            "-stage", "-round", "-party"
+        )
+        self.assertEqual(
+            [revision.version for revision in revisions],
+            ["3.10.5", "3.9.0", "1.0.0"],
+        )
+        revision = revisions[0]
+        self.assertEqual(
+            (revision.stage, revision.round, revision.party), (3, 10, 5)
+        )
+        revision.version = "4.0.0"
+        revision.save(update_fields=["version"])
+        revision.refresh_from_db()
+        self.assertEqual(
+            (revision.stage, revision.round, revision.party), (4, 0, 0)
+        )
+
+    def test_get_or_create_user(self):
+        User = get_user_model()
+        for username in ("reviewer", "reviewer0", "reviewer1", "reviewerx"):
+            User.objects.create_user(username, f"{username}@x.com")
+        self.assertEqual(
+            membership.get_or_create_user("EDITOR@x.com", "other"),
+            self.editor,
+        )
+        self.assertEqual(
+            membership.get_or_create_user("new@x.com", "reviewer").username,
+            "reviewer2",
+        )
+        self.assertEqual(
+            membership.get_or_create_user("new2@x.com", "reviewerx").username,
+            "reviewerx0",
+        )
+        self.assertEqual(
+            membership.get_or_create_user("new3@x.com", "reviewer.").username,
+            "reviewer.",
+        )
+        # The username is taken by another request after it has been found.
+        with mock.patch.object(
+            membership, "get_free_username", side_effect=["editor", "editor7"]
+        ):
+            user = membership.get_or_create_user("new4@x.com", "editor")
+        self.assertEqual(user.username, "editor7")
+
+    def test_get_doc_info_queries(self):
+        versions = ["1.0.0", "3.0.0", "3.0.5", "3.1.0"]
+        submission = self.create_submission(versions)
+        revision = submission.submissionrevision_set.get(version="3.1.0")
+        revision.contributors = {"authors": []}
+        revision.save()
+        self.journal.templates.add(self.template)
+        User = get_user_model()
+        reviewer = User.objects.create_user("reviewer", "reviewer@x.com")
+        for ojs_jid in range(10):
+            user = User.objects.create_user(
+                f"member{ojs_jid}", f"member{ojs_jid}@x.com"
+            )
+            models.Author.objects.create(
+                user=user, submission=submission, ojs_jid=ojs_jid
+            )
+            models.Editor.objects.create(
+                user=user, submission=submission, ojs_jid=ojs_jid, role=17
+            )
+            AccessRight.objects.create(
+                document=revision.document,
+                holder_obj=user,
+                path=revision.document.path,
+                rights="write",
+            )
+        models.Reviewer.objects.create(
+            user=reviewer, revision=revision, ojs_jid=20
+        )
+        AccessRight.objects.create(
+            document=revision.document,
+            holder_obj=reviewer,
+            path=revision.document.path,
+            rights="review",
+        )
+        self.client.force_login(reviewer)
+        # Session, user, document with access right, revision with roles and
+        # journals.
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                "/api/ojs/get_doc_info/", {"doc_id": revision.document_id}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "submission": {
+                    "status": "submitted",
+                    "submission_id": submission.id,
+                    "version": "3.1.0",
+                    "journal_id": self.journal.id,
+                    "user_role": "reviewer",
+                    "contributors": {},
+                },
+                "journals": [
+                    {
+                        "id": self.journal.id,
+                        "name": "Journal",
+                        "editor_id": self.editor.id,
+                        "ojs_jid": 5,
+                    }
+                ],
+            },
+        )
+        self.client.force_login(User.objects.get(username="member3"))
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                "/api/ojs/get_doc_info/", {"doc_id": revision.document_id}
+            )
+        self.assertEqual(
+            response.json()["submission"]["user_role"], "sub-author"
+        )
+        self.assertEqual(
+            response.json()["submission"]["contributors"], {"authors": []}
+        )
+
+    def count_docs_info_queries(self, documents):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                "/api/ojs/get_docs_info/",
+                {"doc_ids[]": [document.id for document in documents]},
+            )
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.json()["submissions"]
+
+    def test_get_docs_info_queries(self):
+        User = get_user_model()
+        other = User.objects.create_user("other", "other@x.com")
+        submission = self.create_submission(["1.0.0", "3.0.0", "3.0.5"])
+        revisions = list(submission.submissionrevision_set.order_by("id"))
+        unsubmitted = Document.objects.create(
+            owner=self.editor,
+            template=self.template,
+            title="Unsubmitted",
+            content={"type": "doc", "content": []},
+        )
+        foreign = Document.objects.create(
+            owner=other,
+            template=self.template,
+            title="Foreign",
+            content={"type": "doc", "content": []},
+        )
+        self.client.force_login(self.editor)
+        few_count, submissions = self.count_docs_info_queries(
+            [revisions[0].document, unsubmitted]
+        )
+        self.assertEqual(
+            submissions,
+            {
+                str(revisions[0].document_id): {
+                    "status": "submitted",
+                    "submission_id": submission.id,
+                    "version": "1.0.0",
+                    "journal_id": self.journal.id,
+                    "user_role": "",
+                    "contributors": {},
+                },
+                str(unsubmitted.id): {"status": "unsubmitted"},
+            },
+        )
+        many_count, submissions = self.count_docs_info_queries(
+            [revision.document for revision in revisions]
+            + [unsubmitted, foreign]
+        )
+        self.assertEqual(few_count, many_count)
+        self.assertEqual(len(submissions), 4)
+        self.assertNotIn(str(foreign.id), submissions)
+        self.assertEqual(
+            submissions[str(revisions[2].document_id)]["version"], "3.0.5"
+        )
+
+    def test_get_doc_info_etag(self):
+        submission = self.create_submission(["1.0.0"])
+        revision = submission.submissionrevision_set.get()
+        self.journal.templates.add(self.template)
+        self.client.force_login(self.editor)
+        url = f"/api/ojs/get_doc_info/?doc_id={revision.document_id}"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertEqual(response.json()["submission"]["version"], "1.0.0")
+        # Session, user, document with the submission's modification time
+        # and the journals' modification times.
+        with self.assertNumQueries(4):
+            response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+        self.count_queries(
+            f"/api/ojs/add_editor/{submission.id}/",
+            {
+                "user_id": 1,
+                "email": "editor@x.com",
+                "username": "editor",
+                "role": 17,
+                "stage_ids": "",
+            },
+            201,
+        )
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(
+            response.json()["submission"]["user_role"], "subeditor"
+        )
+        etag = response["ETag"]
+        self.journal.name = "New name"
+        self.journal.save()
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["journals"][0]["name"], "New name")
+
+    def test_create_copy_rights(self):
+        submission = self.create_submission(["3.0.0"])
+        User = get_user_model()
+        users = [
+            User.objects.create_user(f"user{index}", f"user{index}@ojs.org")
+            for index in range(4)
+        ]
+        for user, ojs_jid, role in (
+            (users[0], 1, 4097),
+            (users[1], 2, 17),
+            (users[2], 3, 16),
+        ):
+            models.Editor.objects.create(
+                user=user, submission=submission, ojs_jid=ojs_jid, role=role
+            )
+        # The third user is both an editor and an author.
+        for user, ojs_jid in ((users[2], 3), (users[3], 4)):
+            models.Author.objects.create(
+                user=user, submission=submission, ojs_jid=ojs_jid
+            )
+        credentials.get_submission_credentials(submission.id)
+        self.count_queries(
+            f"/api/ojs/create_copy/{submission.id}/",
+            {
+                "old_version": "3.0.0",
+                "new_version": "4.0.0",
+                "granted_users": "1,3,",
+            },
+            201,
+        )
+        copy = submission.submissionrevision_set.get(version="4.0.0")
+        self.assertEqual(
+            dict(
+                AccessRight.objects.filter(document=copy.document).values_list(
+                    "holder_id", "rights"
+                )
+            ),
+            {
+                users[0].id: "write-tracked",
+                users[2].id: "write",
+                users[3].id: "write-tracked",
+            },
+        )
+
+    def count_create_copy_queries(self, number_of_images):
+        submission = self.create_submission(["1.0.0"])
+        document = submission.submissionrevision_set.get().document
+        images = Image.objects.bulk_create(
+            [
+                Image(uploader=self.editor, image=f"image{index}.png")
+                for index in range(number_of_images)
+            ]
+        )
+        DocumentImage.objects.bulk_create(
+            [DocumentImage(document=document, image=image) for image in images]
+        )
+        credentials.get_submission_credentials(submission.id)
+        count = self.count_queries(
+            f"/api/ojs/create_copy/{submission.id}/",
+            {
+                "old_version": "1.0.0",
+                "new_version": "3.0.0",
+                "granted_users": "",
+            },
+            201,
+        )
+        copy = submission.submissionrevision_set.get(version="3.0.0")
+        self.assertEqual(
+            set(
+                copy.document.documentimage_set.values_list("image", flat=True)
+            ),
+            {image.id for image in images},
+        )
+        return count
+
+    def test_create_copy_queries(self):
+        self.assertEqual(
+            self.count_create_copy_queries(1),
+            self.count_create_copy_queries(20),
+        )
+
+    @override_settings(OJS_LAZY_REVISIONS=True)
+    def test_lazy_revisions(self):
+        submission = self.create_submission(["1.0.0"])
+        credentials.get_submission_credentials(submission.id)
+        url = f"/api/ojs/%s/{submission.id}/"
+        self.count_queries(
+            url % "add_author",
+            {"user_id": 1, "email": "author@ojs.org", "username": "author"},
+            201,
+        )
+        author = models.Author.objects.get(submission=submission).user
+        document_count = Document.objects.count()
+        for old_version, new_version in (
+            ("1.0.0", "3.0.0"),
+            ("3.0.0", "3.0.5"),
+        ):
+            self.count_queries(
+                url % "create_copy",
+                {
+                    "old_version": old_version,
+                    "new_version": new_version,
+                    "granted_users": "",
+                },
+                201,
+            )
+        self.assertEqual(Document.objects.count(), document_count)
+        review = submission.submissionrevision_set.get(version="3.0.0")
+        revision = submission.submissionrevision_set.get(version="3.0.5")
+        self.assertIsNone(review.document_id)
+        self.assertEqual(revision.source, review)
+        self.assertEqual(revision.pending_rights, {str(author.id): "write"})
+
+        # Members are added to and removed from pending revisions.
+        self.count_queries(
+            url % "add_editor",
+            {
+                "user_id": 2,
+                "email": "editor@ojs.org",
+                "username": "editor",
+                "role": 16,
+                "stage_ids": "1,3",
+            },
+            201,
+        )
+        editor = models.Editor.objects.get(submission=submission).user
+        self.count_queries(url % "remove_author", {"user_id": 1}, 200)
+        revision.refresh_from_db()
+        self.assertEqual(revision.pending_rights, {str(editor.id): "write"})
+        check_url = (
+            f"/api/ojs/check_revision/{submission.id}/3.0.5/"
+            "?key=OJS_KEY&user_id=2&is_editor=1"
+        )
+        self.assertEqual(self.client.get(check_url).content, b"1")
+
+        # The documents are created when the revision is opened.
+        login_token = token.create_token(editor, "OJS_KEY")
+        response = self.client.get(
+            f"/api/ojs/revision/{submission.id}/3.0.5/",
+            {"token": login_token},
+        )
+        revision.refresh_from_db()
+        review.refresh_from_db()
+        self.assertRedirects(
+            response,
+            f"/document/{revision.document_id}/",
+            status_code=301,
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(Document.objects.count(), document_count + 2)
+        self.assertIsNone(revision.source)
+        self.assertEqual(revision.pending_rights, {})
+        for materialized in (review, revision):
+            self.assertEqual(
+                list(
+                    AccessRight.objects.filter(
+                        document=materialized.document
+                    ).values_list("holder_id", "rights")
+                ),
+                [(editor.id, "write")],
+            )
+        self.assertEqual(
+            revision.document.path,
+            f"/Submission {submission.id}/Title (3.0.5)",
+        )
+
+
+class BenchmarkLookupsTest(TestCase):
+    fixtures = ["initial_documenttemplates.json", "initial_styles.json"]
+
+    def test_benchmark_lookups(self):
+        stdout = StringIO()
+        if connection.vendor != "postgresql":
+            with self.assertRaisesMessage(
+                CommandError, "The benchmark needs PostgreSQL."
+            ):
+                call_command("ojs_benchmark_lookups", stdout=stdout)
+            return
+        call_command("ojs_benchmark_lookups", revisions=8, stdout=stdout)
+        self.assertIn("Before:", stdout.getvalue())
+        # The seeded data has been rolled back.
+        self.assertFalse(models.SubmissionRevision.objects.exists())
@@ -39,6 +39,7 @@ urlpatterns = [
     re_path("^get_user/$", views.get_user, name="get_user"),
     re_path("^save_journal/$", views.save_journal, name="save_journal"),
     re_path("^get_doc_info/$", views.get_doc_info, name="get_doc_info"),
+    re_path("^get_docs_info/$", views.get_docs_info, name="get_docs_info"),
     re_path("^author_submit/$", views.author_submit, name="author_submit"),
     re_path(
         "^copyedit_draft_submit/$",
@@ -69,4 +70,9 @@ urlpatterns = [
         views.remove_author,
         name="remove_author",
     ),
+    re_path(
+        "^batch/(?P<submission_id>[0-9]+)/$",
+        views.batch,
+        name="batch",
+    ),
 ]
@@ -1,6 +1,8 @@
 import json
-from httpx import HTTPError, Request
-from urllib.parse import urlencode
+from functools import partial, wraps
+from hashlib import sha256
+from asgiref.sync import sync_to_async
+from httpx import HTTPError
 
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
@@ -15,22 +17,45 @@ from django.shortcuts import redirect
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth import login
-from django.db import IntegrityError
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.decorators.http import require_POST, require_GET
 from django.views.decorators.http import require_http_methods
 
 from allauth.account.models import EmailAddress
 
 from document.models import Document, AccessRight, DocumentTemplate
-from usermedia.models import Image
 
 from . import models
 from . import token
 from . import constants
 from . import helpers
+from . import gateway
+from . import outbox
+from . import credentials
+from . import membership
+from . import push
 
 
-OJS_PLUGIN_PATH = "/index.php/index/gateway/plugin/FidusWriterGatewayPlugin/"
+# The number of seconds a view may spend calling OJS, including retries. These
+# need to stay below the timeout of the proxy in front of Fidus Writer.
+JOURNALS_DEADLINE = 10
+SUBMIT_DEADLINE = 25
+
+
+# Answer with "503 Service Unavailable" instead of an internal error when the
+# OJS server is known to be down.
+def handle_unavailable_ojs(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except gateway.CircuitOpenError as error:
+            return JsonResponse({"error": str(error)}, status=503)
+
+    return wrapper
 
 
 # logs a user in
@@ -44,33 +69,19 @@ def login_user(request, user):
 # If it's none of the two, check if there is authorization to login as an
 # editor and if this is the case, log the user in as the journal's owner.
 # Under all other circumstances, return False.
-def find_user(journal_id, submission_id, version, user_id, is_editor):
-    author = models.Author.objects.filter(
-        submission_id=submission_id, ojs_jid=user_id
-    ).first()
-    if author:
-        # It's an author
-        return author.user
-
-    revision = models.SubmissionRevision.objects.filter(
-        submission_id=submission_id, version=version
-    ).first()
-    if revision:
-        revision_id = revision.id
-        reviewer = models.Reviewer.objects.filter(
-            revision_id=revision_id, ojs_jid=user_id
-        ).first()
-        if reviewer:
-            return reviewer.user
-
-    if is_editor:
-        editor = models.Editor.objects.filter(
-            submission_id=submission_id, ojs_jid=user_id
-        ).first()
-        if editor:
-            return editor.user
-
-    return False
+# The result is remembered for the rest of the request.
+def find_user(request, submission_id, version, user_id, is_editor):
+    found_users = request.__dict__.setdefault("ojs_found_users", {})
+    key = (submission_id, version, user_id, bool(is_editor))
+    if key not in found_users:
+        try:
+            user, role = membership.find_member(
+                int(submission_id), version, int(user_id), is_editor
+            )
+        except (TypeError, ValueError):
+            user = None
+        found_users[key] = user or False
+    return found_users[key]
 
 
 # To login from OJS, the OJS server first gets a temporary login token from the
@@ -83,9 +94,8 @@ def get_login_token(request):
     response = {}
     api_key = request.GET.get("key")
     submission_id = request.GET.get("fidus_id")
-    submission = models.Submission.objects.get(id=submission_id)
-    journal_key = submission.journal.ojs_key
-    journal_id = submission.journal_id
+    journal = credentials.get_submission_credentials(submission_id)
+    journal_key = journal.ojs_key
     if journal_key != api_key:
         # Access forbidden
         response["error"] = "Wrong key"
@@ -101,7 +111,7 @@ def get_login_token(request):
     except ValueError:
         is_editor = 0
 
-    user = find_user(journal_id, submission_id, version, user_id, is_editor)
+    user = find_user(request, submission_id, version, user_id, is_editor)
     if not user:
         response["error"] = "User not accessible"
         return JsonResponse(response, status=403)
@@ -122,13 +132,15 @@ def open_revision_doc(request, submission_id, version):
     user = User.objects.get(id=user_id)
     if user is None:
         return HttpResponse("Invalid user", status=404)
-    rev = models.SubmissionRevision.objects.get(
+    rev = models.SubmissionRevision.objects.select_related("document").get(
         submission_id=submission_id, version=version
     )
-    key = rev.submission.journal.ojs_key
+    key = credentials.get_submission_credentials(submission_id).ojs_key
 
     if not token.check_token(user, key, login_token):
         return HttpResponse("No access", status=403)
+    if rev.document_id is None:
+        rev = helpers.materialize_revision(rev.id)
     if (
         rev.document.owner != user
         and AccessRight.objects.filter(
@@ -151,9 +163,8 @@ def open_revision_doc(request, submission_id, version):
 @require_GET
 def check_revision_doc(request, submission_id, version):
     api_key = request.GET.get("key")
-    submission = models.Submission.objects.get(id=submission_id)
-    journal_key = submission.journal.ojs_key
-    journal_id = submission.journal_id
+    journal = credentials.get_submission_credentials(submission_id)
+    journal_key = journal.ojs_key
     res = 0
 
     # Validate api key
@@ -167,121 +178,290 @@ def check_revision_doc(request, submission_id, version):
         except ValueError:
             is_editor = 0
 
-        user = find_user(
-            journal_id, submission_id, version, user_id, is_editor
-        )
+        user = find_user(request, submission_id, version, user_id, is_editor)
 
         # Validate if user exists
         if not user:
             return HttpResponse("User not accessible", status=403)
 
-        # Validate if doc exists
-        try:
-            models.SubmissionRevision.objects.get(
-                submission_id=submission_id, version=version
-            )
+        # Validate if doc exists. The document of a pending revision is
+        # created when it is opened.
+        if models.SubmissionRevision.objects.filter(
+            submission_id=submission_id, version=version
+        ).exists():
             res = 1
-        except Exception:
-            res = 0
 
     return HttpResponse(res, status=200)
 
 
+# Revisions of documents, annotated with the roles of a user in them.
+def get_revisions_with_roles(user, document_ids):
+    return (
+        models.SubmissionRevision.objects.filter(document_id__in=document_ids)
+        .select_related("submission")
+        .annotate(
+            review_method=Subquery(
+                models.Reviewer.objects.filter(
+                    revision_id=OuterRef("id"), user=user
+                ).values("method")[:1]
+            ),
+            is_author=Exists(
+                models.Author.objects.filter(
+                    submission_id=OuterRef("submission_id"), user=user
+                )
+            ),
+            editor_role=Subquery(
+                models.Editor.objects.filter(
+                    submission_id=OuterRef("submission_id"), user=user
+                ).values("role")[:1]
+            ),
+        )
+    )
+
+
+# The submission information about a document as seen by a user, given the
+# document's revision from get_revisions_with_roles, if any.
+def get_submission_info(revision, user):
+    if not revision:
+        return {"status": "unsubmitted"}
+    user_role = ""
+    if revision.review_method:
+        user_role = "reviewer"
+    elif revision.is_author:
+        # User with author role but not submission submitter as sub-author
+        user_role = (
+            "author"
+            if revision.submission.submitter_id == user.id
+            else "sub-author"
+        )
+    elif revision.editor_role in constants.EDITOR_ROLES:
+        user_role = constants.EDITOR_ROLES[revision.editor_role]
+    if revision.review_method == "doubleanonymous":
+        contributors = {}
+    else:
+        contributors = revision.contributors
+    return {
+        "status": "submitted",
+        "submission_id": revision.submission.id,
+        "version": revision.version,
+        "journal_id": revision.submission.journal_id,
+        "user_role": user_role,
+        "contributors": contributors,
+    }
+
+
+# The ETag of the information that get_doc_info sends about a document. It is
+# derived from the times at which the submission of the document and the
+# journals for its template were last changed, so that it can be checked
+# before the information is put together.
+def get_doc_info_etag(user, document_id, submission_modified, journals):
+    stamp = [user.id, document_id, submission_modified]
+    stamp += journals.order_by("id").values_list("id", "modified")
+    return f'"{sha256(str(stamp).encode()).hexdigest()}"'
+
+
 # Send basic information about the current document and the journals that can
 # be submitted to. This information is used as a starting point to decide what
 # OJS-related UI elements to add on the editor page.
+# When requested with GET, the response carries an ETag so that clients can
+# keep the information and revalidate it cheaply.
 @login_required
-@require_POST
+@require_http_methods(["GET", "POST"])
 def get_doc_info(request):
+    params = request.GET if request.method == "GET" else request.POST
     response = {}
-    document_id = int(request.POST.get("doc_id"))
+    document_id = int(params.get("doc_id"))
     if document_id == 0:
-        response["submission"] = {"status": "unsubmitted"}
-        template_id = int(request.POST.get("template_id"))
+        template_id = int(params.get("template_id"))
+        submission_modified = None
     else:
-        document = Document.objects.get(id=document_id)
+        document = (
+            Document.objects.filter(id=document_id)
+            .annotate(
+                has_access=Exists(
+                    AccessRight.objects.filter(
+                        document_id=OuterRef("id"), user=request.user
+                    )
+                ),
+                submission_modified=Subquery(
+                    models.SubmissionRevision.objects.filter(
+                        document_id=OuterRef("id")
+                    ).values("submission__modified")[:1]
+                ),
+            )
+            .values(
+                "owner_id", "template_id", "has_access", "submission_modified"
+            )
+            .get()
+        )
         if (
-            document.owner != request.user
-            and AccessRight.objects.filter(
-                document=document, user=request.user
-            ).count()
-            == 0
+            document["owner_id"] != request.user.id
+            and not document["has_access"]
         ):
             # Access forbidden
             return HttpResponse("Missing access rights", status=403)
-        template_id = document.template_id
+        template_id = document["template_id"]
+        submission_modified = document["submission_modified"]
+    journals = models.Journal.objects.filter(templates=template_id)
+
+    http_response = HttpResponse(content_type="application/json")
+    if request.method == "GET":
+        etag = get_doc_info_etag(
+            request.user, document_id, submission_modified, journals
+        )
+        http_response["ETag"] = etag
+        patch_cache_control(http_response, private=True, no_cache=True)
+        conditional_response = get_conditional_response(
+            request, etag=etag, response=http_response
+        )
+        if conditional_response is not http_response:
+            # The client's copy is still current.
+            return conditional_response
+
+    if submission_modified is None:
+        response["submission"] = {"status": "unsubmitted"}
+    else:
         # OJS submission related
-        response["submission"] = dict()
-        revision = models.SubmissionRevision.objects.filter(
-            document_id=document_id
+        revision = get_revisions_with_roles(
+            request.user, [document_id]
         ).first()
-        if revision:
-            user_role = ""
-            reviewer = revision.reviewer_set.filter(user=request.user).first()
-            if reviewer:
-                user_role = "reviewer"
-            elif (
-                revision.submission.author_set.filter(
-                    user=request.user
-                ).count()
-                > 0
-            ):
-                # User with author role but not submission submitter as sub-author
-                user_role = (
-                    "author"
-                    if revision.submission.submitter.id == request.user.id
-                    else "sub-author"
+        response["submission"] = get_submission_info(revision, request.user)
+    response["journals"] = list(
+        journals.values("id", "name", "editor_id", "ojs_jid")
+    )
+    http_response.content = json.dumps(response, sort_keys=True)
+    return http_response
+
+
+# Send the submission information of several documents at once. Documents
+# the user has no access to are left out.
+@login_required
+@require_POST
+def get_docs_info(request):
+    document_ids = [int(id) for id in request.POST.getlist("doc_ids[]")]
+    accessible_ids = list(
+        Document.objects.filter(id__in=document_ids)
+        .annotate(
+            has_access_right=Exists(
+                AccessRight.objects.filter(
+                    document_id=OuterRef("id"), user=request.user
                 )
-            else:
-                editor = revision.submission.editor_set.filter(
-                    user=request.user
-                ).first()
-                if editor and editor.role in constants.EDITOR_ROLES:
-                    user_role = constants.EDITOR_ROLES[editor.role]
-
-            response["submission"]["status"] = "submitted"
-            response["submission"]["submission_id"] = revision.submission.id
-            response["submission"]["version"] = revision.version
-            response["submission"][
-                "journal_id"
-            ] = revision.submission.journal_id
-            response["submission"]["user_role"] = user_role
-            if reviewer and reviewer.method == "doubleanonymous":
-                response["submission"]["contributors"] = {}
-            else:
-                response["submission"]["contributors"] = revision.contributors
-        else:
-            response["submission"]["status"] = "unsubmitted"
-    journals = []
-    for journal in models.Journal.objects.filter(templates=template_id):
-        journals.append(
-            {
-                "id": journal.id,
-                "name": journal.name,
-                "editor_id": journal.editor_id,
-                "ojs_jid": journal.ojs_jid,
-            }
+            )
         )
-    response["journals"] = journals
-
-    status = 200
-    return JsonResponse(response, status=status)
+        .filter(Q(owner=request.user) | Q(has_access_right=True))
+        .values_list("id", flat=True)
+    )
+    revisions = {}
+    for revision in get_revisions_with_roles(
+        request.user, accessible_ids
+    ).order_by("id"):
+        revisions.setdefault(revision.document_id, revision)
+    submissions = {
+        document_id: get_submission_info(
+            revisions.get(document_id), request.user
+        )
+        for document_id in accessible_ids
+    }
+    return JsonResponse({"submissions": submissions}, status=200)
 
 
 @login_required
 @require_GET
+@handle_unavailable_ojs
 async def get_journals(request):
-    base_url = request.GET["url"]
-    key = request.GET["key"]
-    url = f"{base_url}{OJS_PLUGIN_PATH}journals"
-    response = await helpers.send_async(
-        Request("GET", url, params={"key": key})
+    url = request.GET["url"]
+    # Any user can ask for the journals of any host, so only the hosts of
+    # registered journals share the clients and state kept for OJS hosts.
+    journals = await helpers.get_journals(
+        url,
+        request.GET["key"],
+        deadline=JOURNALS_DEADLINE,
+        pooled=await helpers.is_journal_host(url),
     )
-    return HttpResponse(response.content)
+    return HttpResponse(journals, content_type="application/json")
+
+
+# Replace the user's write access to a submitted revision with read access and
+# record the notification to OJS for the outbox worker.
+@transaction.atomic
+def queue_notification(journal, endpoint, data, user, document):
+    outbox.enqueue(journal, endpoint, data)
+    AccessRight.objects.filter(user=user, document=document).update(
+        rights="read"
+    )
+    transaction.on_commit(
+        partial(push.push_rights, document.id, {user.id: "read"})
+    )
+
+
+# Replace the write access of a user who has submitted a document with read
+# access. The user's open editors are updated.
+async def revoke_write_access(user, document):
+    right = await AccessRight.objects.aget(user=user, document=document)
+    right.rights = "read"
+    await right.asave()
+    await sync_to_async(push.push_rights)(document.id, {user.id: "read"})
+
+
+def get_first_submission_data(
+    request, user, journal, submission, title, version
+):
+    return {
+        "username": user.username,
+        "title": title,
+        "abstract": request.POST["abstract"],
+        "first_name": request.POST["firstname"],
+        "last_name": request.POST["lastname"],
+        "email": user.email,
+        "affiliation": request.POST["affiliation"],
+        "author_url": request.POST["author_url"],
+        "journal_id": journal.ojs_jid,
+        "fidus_url": request.build_absolute_uri("/")[:-1],
+        "fidus_id": submission.id,
+        "version": version,
+    }
+
+
+# Create the submission and its first revision and record the notification to
+# OJS for the outbox worker.
+@transaction.atomic
+def queue_first_submission(
+    request,
+    user,
+    journal,
+    template,
+    title,
+    content,
+    bibliography,
+    images,
+    version,
+):
+    submission = models.Submission.objects.create(
+        submitter=user, journal=journal
+    )
+    document = helpers.create_doc(
+        journal.editor,
+        template,
+        title,
+        content,
+        bibliography,
+        images,
+        {},
+        submission.id,
+        version,
+    )
+    revision = models.SubmissionRevision.objects.create(
+        submission=submission, version=version, document=document
+    )
+    data = get_first_submission_data(
+        request, user, journal, submission, title, version
+    )
+    outbox.enqueue(journal, "authorSubmit", data, revision=revision, user=user)
 
 
 @login_required
 @require_POST
+@handle_unavailable_ojs
 async def author_submit(request):
     # Submitting a new submission revision.
     document_id = request.POST["doc_id"]
@@ -304,26 +484,19 @@ async def author_submit(request):
             "version": revision.version,
         }
         journal = submission.journal
-        key = journal.ojs_key
-        base_url = journal.ojs_url
-        url = f"{base_url}{OJS_PLUGIN_PATH}authorSubmit"
-        response = await helpers.send_async(
-            Request(
-                "POST",
-                url,
-                params={"key": key},
-                headers={"Content-Type": "application/x-www-form-urlencoded"},
-                content=urlencode(data),
+        if outbox.is_enabled():
+            await sync_to_async(queue_notification)(
+                journal, "authorSubmit", data, request_user, revision.document
             )
+            return HttpResponse(status=202)
+        response = await helpers.send_async(
+            helpers.create_post_request(journal, "authorSubmit", data),
+            deadline=SUBMIT_DEADLINE,
         )
 
         # submission was successful, so we replace the user's write access
         # rights with read rights.
-        right = await AccessRight.objects.aget(
-            user=request_user, document=revision.document
-        )
-        right.rights = "read"
-        await right.asave()
+        await revoke_write_access(request_user, revision.document)
 
         return HttpResponse(response.content)
     else:
@@ -340,28 +513,49 @@ async def author_submit(request):
         if not template:
             # Template is not available for Journal.
             return HttpResponseForbidden()
-        submission = await models.Submission.objects.acreate(
-            submitter=request_user, journal_id=journal_id
+        document = await sync_to_async(helpers.get_current_document)(
+            int(document_id)
         )
+        if (
+            document.owner_id != request_user.id
+            and not await AccessRight.objects.filter(
+                document=document, user=request_user
+            ).aexists()
+        ):
+            # Trying to submit a document of another user
+            return HttpResponseForbidden()
         version = "1.0.0"
-        # Connect a new document to the submission.
-        title = request.POST["title"]
-        abstract = request.POST["abstract"]
-        content = request.POST["content"]
-        bibliography = request.POST["bibliography"]
-        image_ids = request.POST.getlist("image_ids[]")
-
-        images = []
-        for id in image_ids:
-            image = await Image.objects.filter(id=id).afirst()
-            images.append(image)
+        # Connect a copy of the document to the submission.
+        title = document.title
+        content, bibliography, image_ids = helpers.shrink_doc(document)
 
+        images = await helpers.get_images(
+            image_ids, documentimage__document=document
+        )
+
+        if outbox.is_enabled():
+            await sync_to_async(queue_first_submission)(
+                request,
+                request_user,
+                journal,
+                template,
+                title,
+                content,
+                bibliography,
+                images,
+                version,
+            )
+            return HttpResponse(status=202)
+
+        submission = await models.Submission.objects.acreate(
+            submitter=request_user, journal_id=journal_id
+        )
         document = await helpers.create_doc_async(
             journal.editor,
             template,
             title,
-            json.loads(content),
-            json.loads(bibliography),
+            content,
+            bibliography,
             images,
             {},
             submission.id,
@@ -371,74 +565,31 @@ async def author_submit(request):
             submission=submission, version=version, document=document
         )
 
-        fidus_url = request.build_absolute_uri("/")[:-1]
-
-        data = {
-            "username": request_user.username.encode("utf8"),
-            "title": title.encode("utf8"),
-            "abstract": abstract.encode("utf8"),
-            "first_name": request.POST["firstname"].encode("utf8"),
-            "last_name": request.POST["lastname"].encode("utf8"),
-            "email": request_user.email.encode("utf8"),
-            "affiliation": request.POST["affiliation"].encode("utf8"),
-            "author_url": request.POST["author_url"].encode("utf8"),
-            "journal_id": journal.ojs_jid,
-            "fidus_url": fidus_url,
-            "fidus_id": submission.id,
-            "version": version,
-        }
-        key = journal.ojs_key
-        base_url = journal.ojs_url
-        url = f"{base_url}{OJS_PLUGIN_PATH}authorSubmit"
+        data = get_first_submission_data(
+            request, request_user, journal, submission, title, version
+        )
         try:
             response = await helpers.send_async(
-                Request(
-                    "POST",
-                    url,
-                    params={"key": key},
-                    headers={
-                        "Content-Type": "application/x-www-form-urlencoded"
-                    },
-                    content=urlencode(data),
-                )
+                helpers.create_post_request(journal, "authorSubmit", data),
+                deadline=SUBMIT_DEADLINE,
             )
         except HTTPError:
             await document.adelete()
             await revision.adelete()
             raise
-        # Set the submission ID from the response from the OJS server.
-        body_json = json.loads(response.content)
-        submission.ojs_jid = body_json["submission_id"]
-        await submission.asave()
-
-        # We save the author ID on the OJS site. Currently we are NOT using
-        # this information for login purposes.
-        author = await models.Author.objects.filter(
-            submission=submission.id, ojs_jid=body_json["user_id"]
-        ).afirst()
-        if author is None:
-            await models.Author.objects.acreate(
-                user=request_user,
-                submission=submission,
-                ojs_jid=body_json["user_id"],
-            )
-            await AccessRight.objects.acreate(
-                document=revision.document,
-                holder_obj=request_user,
-                path=revision.document.path,
-                rights="read-without-comments",
-            )
+        await helpers.register_submission(revision, request_user, response)
         return HttpResponse(response.content)
 
 
 @login_required
 @require_POST
+@handle_unavailable_ojs
 async def copyedit_draft_submit(request):
     document_id = request.POST["doc_id"]
     request_user = await request.auser()
     revision = (
         await models.SubmissionRevision.objects.filter(document_id=document_id)
-        .select_related("submission__journal")
+        .select_related("submission__journal", "document")
         .afirst()
     )
     if not revision:
@@ -464,31 +615,29 @@ async def copyedit_draft_submit(request):
         return HttpResponseForbidden()
 
     data = {"submission_id": submission.ojs_jid, "ojs_uid": ojs_uid}
-    key = journal.ojs_key
-    base_url = journal.ojs_url
-    url = f"{base_url}{OJS_PLUGIN_PATH}copyeditDraftSubmit"
-    response = await helpers.send_async(
-        Request(
-            "POST",
-            url,
-            params={"key": key},
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            content=urlencode(data),
+    if outbox.is_enabled():
+        await sync_to_async(queue_notification)(
+            journal,
+            "copyeditDraftSubmit",
+            data,
+            request_user,
+            revision.document,
         )
+        return HttpResponse(status=202)
+    response = await helpers.send_async(
+        helpers.create_post_request(journal, "copyeditDraftSubmit", data),
+        deadline=SUBMIT_DEADLINE,
     )
 
     # submission was successful, so we replace the user's write access
     # rights with read rights.
-    right = await AccessRight.objects.aget(
-        user=request_user, document=revision.document
-    )
-    right.rights = "read"
-    await right.asave()
+    await revoke_write_access(request_user, revision.document)
     return HttpResponse(response.content)
 
 
 @login_required
 @require_POST
+@handle_unavailable_ojs
 async def reviewer_submit(request):
     # Submitting a new submission revision.
     document_id = request.POST["doc_id"]
@@ -512,25 +661,23 @@ async def reviewer_submit(request):
         "recommendation": request.POST["recommendation"],
     }
 
-    key = reviewer.revision.submission.journal.ojs_key
-    base_url = reviewer.revision.submission.journal.ojs_url
-    url = f"{base_url}{OJS_PLUGIN_PATH}reviewerSubmit"
-    response = await helpers.send_async(
-        Request(
-            "POST",
-            url,
-            params={"key": key},
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            content=urlencode(data),
+    journal = reviewer.revision.submission.journal
+    if outbox.is_enabled():
+        await sync_to_async(queue_notification)(
+            journal,
+            "reviewerSubmit",
+            data,
+            request_user,
+            reviewer.revision.document,
         )
+        return HttpResponse(status=202)
+    response = await helpers.send_async(
+        helpers.create_post_request(journal, "reviewerSubmit", data),
+        deadline=SUBMIT_DEADLINE,
     )
     # submission was successful, so we replace the user's write access
     # rights with read rights.
-    right = await AccessRight.objects.aget(
-        user=request_user, document=reviewer.revision.document
-    )
-    right.rights = "read"
-    await right.asave()
+    await revoke_write_access(request_user, reviewer.revision.document)
     return HttpResponse(response.content)
 
 
@@ -570,168 +717,47 @@ def save_journal(request):
     return JsonResponse(response, status=status)
 
 
-# Return an existing user or create a new one. The email/username come from
-# OJS. We return an existing user if it has the same email as the OJS user
-# as we expect OJS to have checked whether the user actually has access to the
-# email. We do not automatically connect to a user with the same username,
-# as this may be purely coincidental.
-# NOTE: An evil OJS editor can get access to accounts that he does not have
-# email access for this way.
-def get_or_create_user(email, username):
-    User = get_user_model()
-    user_with_email = User.objects.filter(email=email).first()
-    if user_with_email:
-        return user_with_email
-    # try to find an unused username, starting with the username used in OJS
-    counter = 0
-    usernamebase = username
-    while User.objects.filter(username=username).first():
-        username = f"{usernamebase}{counter}"
-        counter += 1
-    return User.objects.create_user(username, email)
+# Check the key sent by OJS and run a membership operation on the submission.
+def run_membership_operation(request, submission_id, operation, **params):
+    api_key = request.POST.get("key")
+    journal_key = credentials.get_submission_credentials(submission_id).ojs_key
+    if journal_key != api_key:
+        # Access forbidden
+        return JsonResponse({"error": "Wrong key"}, status=403)
+    context = membership.SubmissionContext(submission_id)
+    with transaction.atomic():
+        status, response = operation(
+            context, dict(request.POST.items(), **params)
+        )
+        context.save()
+    return JsonResponse(response, status=status)
 
 
 # A reviewer has accepted a review. Give comment/review access to the reviewer.
 @csrf_exempt
 @require_POST
 def accept_reviewer(request, submission_id, version):
-    response = {}
-    status = 200
-    api_key = request.POST.get("key")
-    revision = models.SubmissionRevision.objects.get(
-        submission_id=submission_id, version=version
+    return run_membership_operation(
+        request, submission_id, membership.accept_reviewer, version=version
     )
-    journal_key = revision.submission.journal.ojs_key
-    if journal_key != api_key:
-        # Access forbidden
-        response["error"] = "Wrong key"
-        status = 403
-        return JsonResponse(response, status=status)
-
-    ojs_jid = int(request.POST.get("user_id"))
-    reviewer = models.Reviewer.objects.filter(
-        revision=revision, ojs_jid=ojs_jid
-    ).first()
-    if reviewer is None:
-        response["error"] = "Unknown reviewer"
-        status = 403
-        return JsonResponse(response, status=status)
-    review_method = request.POST.get("review_method")
-
-    # ojs-fiduswriter < 3.0.0.0 specified "access_rights" instead of "review_method".
-    if not review_method:
-        if request.POST.get("access_rights") == "comment":
-            review_method = "open"
-        else:
-            review_method = "doubleanonymous"
-
-    reviewer.method = review_method
-    reviewer.save()
-
-    if review_method == "open":
-        rights = "comment"
-    else:
-        rights = "review"
-    # Make sure the connect document has reviewer access rights set for the
-    # user.
-    access_right = AccessRight.objects.filter(
-        document=revision.document, user=reviewer.user
-    ).first()
-    if access_right is None:
-        access_right = AccessRight(
-            document=revision.document,
-            holder_obj=reviewer.user,
-            path=revision.document.path,
-        )
-        status = 201
-
-    access_right.rights = rights
-    access_right.save()
-    return JsonResponse(response, status=status)
 
 
 # Add a reviewer to the document connected to a SubmissionRevision as a
 # reviewer.
-# Also ensure that there is an Reviewer set up for the account to allow for
-# password-less login from OJS.
 @csrf_exempt
 @require_POST
 def add_reviewer(request, submission_id, version):
-    response = {}
-    status = 200
-    api_key = request.POST.get("key")
-    revision = models.SubmissionRevision.objects.get(
-        submission_id=submission_id, version=version
+    return run_membership_operation(
+        request, submission_id, membership.add_reviewer, version=version
     )
-    journal_key = revision.submission.journal.ojs_key
-    if journal_key != api_key:
-        # Access forbidden
-        response["error"] = "Wrong key"
-        status = 403
-        return JsonResponse(response, status=status)
-
-    ojs_jid = int(request.POST.get("user_id"))
-
-    # Make sure there is an Reviewer/user registered for the reviewer.
-    reviewer = models.Reviewer.objects.filter(
-        revision=revision, ojs_jid=ojs_jid
-    ).first()
-    if reviewer is None:
-        email = request.POST.get("email")
-        username = request.POST.get("username")
-        user = get_or_create_user(email, username)
-        reviewer = models.Reviewer.objects.create(
-            revision=revision, ojs_jid=ojs_jid, user=user
-        )
-        status = 201
-    # Make sure the connect document has reviewer access rights set for the
-    # user.
-    access_right = AccessRight.objects.filter(
-        document=revision.document, user=reviewer.user
-    ).first()
-    if access_right is None:
-        access_right = AccessRight(
-            document=revision.document,
-            holder_obj=reviewer.user,
-            path=revision.document.path,
-        )
-        status = 201
-    access_right.rights = "read-without-comments"
-    access_right.save()
-    return JsonResponse(response, status=status)
 
 
 @csrf_exempt
 @require_POST
 def remove_reviewer(request, submission_id, version):
-    response = {}
-    status = 200
-    api_key = request.POST.get("key")
-    revision = models.SubmissionRevision.objects.get(
-        submission_id=submission_id, version=version
+    return run_membership_operation(
+        request, submission_id, membership.remove_reviewer, version=version
     )
-    journal_key = revision.submission.journal.ojs_key
-    if journal_key != api_key:
-        # Access forbidden
-        response["error"] = "Wrong key"
-        status = 403
-        return JsonResponse(response, status=status)
-
-    ojs_jid = int(request.POST.get("user_id"))
-    # Delete reviewer access rights set for the corresponding user,
-    # if there are any. Thereafter delete the Reviewer.
-    reviewer = models.Reviewer.objects.filter(
-        revision=revision, ojs_jid=ojs_jid
-    ).first()
-    if reviewer is None:
-        response["error"] = "Unknown reviewer"
-        status = 403
-        return JsonResponse(response, status=status)
-    AccessRight.objects.filter(
-        document=revision.document, user=reviewer.user
-    ).delete()
-    reviewer.delete()
-    return JsonResponse(response, status=status)
 
 
 @csrf_exempt
@@ -741,65 +767,97 @@ def create_copy(request, submission_id):
     status = 201
     api_key = request.POST.get("key")
     old_version = request.POST.get("old_version")
-    old_version_parts = old_version.split(".")
-    old_version_stage = int(old_version_parts[0])
-
     new_version = request.POST.get("new_version")
-    new_version_parts = new_version.split(".")
-    new_version_stage = int(new_version_parts[0])
-
-    revision = models.SubmissionRevision.objects.get(
-        submission_id=submission_id, version=old_version
+    new_version_stage, _round, new_version_party = models.parse_version(
+        new_version
     )
-    journal_key = revision.submission.journal.ojs_key
+
+    journal_key = credentials.get_submission_credentials(submission_id).ojs_key
     if journal_key != api_key:
         # Access forbidden
         response["error"] = "Wrong key"
         status = 403
         return JsonResponse(response, status=status)
-
-    # Copy the revision
-    revision = helpers.copy_revision(
-        revision, old_version_stage, new_version_stage, new_version
+    revision = (
+        models.SubmissionRevision.objects.select_related(
+            "submission__journal__editor", "document__template"
+        )
+        .defer(
+            "document__content",
+            "document__bibliography",
+            "document__comments",
+            "document__diffs",
+        )
+        .get(submission_id=submission_id, version=old_version)
     )
 
-    # Add user rights
-
     # Rights for editors
-    granted_user_ids = request.POST.get("granted_users").split(",")
-    if granted_user_ids:
-        editors = models.Editor.objects.filter(submission=revision.submission)
-        if editors is not None:
-            for editor in editors:
-                if str(editor.ojs_jid) in granted_user_ids:
-                    role = int(editor.role)
-                    rights = constants.EDITOR_ROLE_STAGE_RIGHTS[role][
-                        new_version_stage
-                    ]
-                    AccessRight.objects.create(
-                        document=revision.document,
-                        holder_obj=editor.user,
-                        path=revision.document.path,
-                        rights=rights,
-                    )
+    granted_user_ids = [
+        int(user_id)
+        for user_id in request.POST.get("granted_users").split(",")
+        if user_id.strip().isdigit()
+    ]
+    user_rights = {}
+    for user_id, role in models.Editor.objects.filter(
+        submission_id=submission_id, ojs_jid__in=granted_user_ids
+    ).values_list("user_id", "role"):
+        user_rights[user_id] = constants.EDITOR_ROLE_STAGE_RIGHTS[int(role)][
+            new_version_stage
+        ]
 
     # Rights for authors
-    if new_version_stage == 4 or new_version_parts[-1] == "5":
+    if new_version_stage == 4 or new_version_party == 5:
         # We have an author version and we give the author write access.
         if new_version_stage == 4:
             access_right = "write-tracked"
         else:
             access_right = "write"
 
-        authors = models.Author.objects.filter(submission=revision.submission)
-        for author in authors:
-            AccessRight.objects.create(
-                document=revision.document,
-                holder_obj=author.user,
-                path=revision.document.path,
-                rights=access_right,
+        for user_id in models.Author.objects.filter(
+            submission_id=submission_id
+        ).values_list("user_id", flat=True):
+            # A user can only have one access right per document. Editors
+            # keep their editor rights.
+            user_rights.setdefault(user_id, access_right)
+
+    old_document_id = revision.document_id
+    if getattr(settings, "OJS_LAZY_REVISIONS", False):
+        # Only record the new revision. Its document is copied when it is
+        # first needed.
+        models.SubmissionRevision.objects.create(
+            submission_id=submission_id,
+            version=new_version,
+            source=revision,
+            pending_rights={
+                str(user_id): rights for user_id, rights in user_rights.items()
+            },
+        )
+    else:
+        if old_document_id is None:
+            revision = helpers.materialize_revision(revision.id)
+            old_document_id = revision.document_id
+        user_type = ContentType.objects.get_for_model(get_user_model())
+        with transaction.atomic():
+            # Copy the revision
+            revision = helpers.copy_revision(
+                revision, revision.stage, new_version_stage, new_version
             )
-
+            AccessRight.objects.bulk_create(
+                [
+                    AccessRight(
+                        document=revision.document,
+                        holder_type=user_type,
+                        holder_id=user_id,
+                        path=revision.document.path,
+                        rights=rights,
+                    )
+                    for user_id, rights in user_rights.items()
+                ]
+            )
+    if old_document_id is not None:
+        transaction.on_commit(
+            partial(push.push_submission_change, old_document_id, new_version)
+        )
     return JsonResponse(response, status=status)
 
 
@@ -808,64 +866,9 @@ def create_copy(request, submission_id):
 @csrf_exempt
 @require_POST
 def add_editor(request, submission_id):
-    response = {}
-    status = 200
-    api_key = request.POST.get("key")
-    submission = models.Submission.objects.get(id=submission_id)
-    journal_key = submission.journal.ojs_key
-    if journal_key != api_key:
-        # Access forbidden
-        response["error"] = "Wrong key"
-        return JsonResponse(response, status=403)
-
-    ojs_jid = int(request.POST.get("user_id"))
-
-    # check, if editor account already exists
-    editor = models.Editor.objects.filter(
-        submission=submission_id, ojs_jid=ojs_jid
-    ).first()
-
-    # if no editor exists, create one
-    if editor is None:
-        email = request.POST.get("email")
-        username = request.POST.get("username")
-        role = request.POST.get("role")
-        user = get_or_create_user(email, username)
-        editor = models.Editor.objects.create(
-            user=user, submission=submission, ojs_jid=ojs_jid, role=role
-        )
-        status = 201
-
-    # create access_rights for existing revisions
-    # get ids of stages access granted
-    granted_stage_ids = request.POST.get("stage_ids").split(",")
-    if granted_stage_ids:
-        revisions = models.SubmissionRevision.objects.filter(
-            submission_id=submission_id
-        )
-        if revisions is not None:
-            for revision in revisions:
-                version = revision.version.split(".")
-                stage_id = version[0]
-                if stage_id in granted_stage_ids:
-                    access_right = AccessRight.objects.filter(
-                        document=revision.document, user=editor.user
-                    ).first()
-                    if access_right is None:
-                        role = int(editor.role)
-                        rights = constants.EDITOR_ROLE_STAGE_RIGHTS[role][
-                            int(stage_id)
-                        ]
-                        access_right = AccessRight(
-                            document=revision.document,
-                            holder_obj=editor.user,
-                            path=revision.document.path,
-                        )
-                        access_right.rights = rights
-                        access_right.save()
-                        status = 201
-
-    return JsonResponse(response, status=status)
+    return run_membership_operation(
+        request, submission_id, membership.add_editor
+    )
 
 
 # Remove editor
@@ -873,39 +876,9 @@ def add_editor(request, submission_id):
 @csrf_exempt
 @require_POST
 def remove_editor(request, submission_id):
-    response = {}
-    status = 200
-    api_key = request.POST.get("key")
-    submission = models.Submission.objects.get(id=submission_id)
-    journal_key = submission.journal.ojs_key
-    if journal_key != api_key:
-        # Access forbidden
-        response["error"] = "Wrong key"
-        return JsonResponse(response, status=403)
-
-    ojs_jid = int(request.POST.get("user_id"))
-
-    # check, if editor account already exists
-    editor = models.Editor.objects.filter(
-        submission=submission_id, ojs_jid=ojs_jid
-    ).first()
-    if editor is None:
-        response["error"] = "Unknown reviewer"
-        status = 403
-        return JsonResponse(response, status=status)
-
-    revisions = models.SubmissionRevision.objects.filter(
-        submission_id=submission_id
+    return run_membership_operation(
+        request, submission_id, membership.remove_editor
     )
-    if revisions is not None:
-        for revision in revisions:
-            AccessRight.objects.filter(
-                document=revision.document, user=editor.user
-            ).delete()
-
-    editor.delete()
-
-    return JsonResponse(response, status=status)
 
 
 # Add a author connected to a submission
@@ -913,69 +886,9 @@ def remove_editor(request, submission_id):
 @csrf_exempt
 @require_POST
 def add_author(request, submission_id):
-    response = {}
-    status = 200
-    api_key = request.POST.get("key")
-    submission = models.Submission.objects.get(id=submission_id)
-    journal_key = submission.journal.ojs_key
-    if journal_key != api_key:
-        # Access forbidden
-        response["error"] = "Wrong key"
-        return JsonResponse(response, status=403)
-
-    ojs_jid = int(request.POST.get("user_id"))
-
-    # check, if author account already exists
-    author = models.Author.objects.filter(
-        submission=submission_id, ojs_jid=ojs_jid
-    ).first()
-
-    # if no author exists, create one
-    if author is None:
-        email = request.POST.get("email")
-        username = request.POST.get("username")
-        user = get_or_create_user(email, username)
-        author = models.Author.objects.create(
-            user=user, submission=submission, ojs_jid=ojs_jid
-        )
-        status = 201
-
-    # create access_rights for existing revisions
-    # get ids of stages access granted
-    revisions = models.SubmissionRevision.objects.filter(
-        submission_id=submission_id
+    return run_membership_operation(
+        request, submission_id, membership.add_author
     )
-    if revisions is not None:
-        for revision in revisions:
-            version = revision.version.split(".")
-            stage_id = version[0]
-            if (
-                stage_id == "1"
-                or stage_id == "4"
-                or (stage_id == "3" and version[2] == "5")
-            ):
-                access_right = AccessRight.objects.filter(
-                    document=revision.document, user=author.user
-                ).first()
-
-                if access_right is None:
-                    access_right = AccessRight(
-                        document=revision.document,
-                        holder_obj=author.user,
-                        path=revision.document.path,
-                    )
-
-                    if stage_id == "1":
-                        access_right.rights = "read-without-comments"
-                    elif stage_id == "3":
-                        access_right.rights = "write"
-                    else:
-                        access_right.rights = "write-tracked"
-
-                    access_right.save()
-                    status = 201
-
-    return JsonResponse(response, status=status)
 
 
 # Remove author
@@ -983,36 +896,51 @@ def add_author(request, submission_id):
 @csrf_exempt
 @require_POST
 def remove_author(request, submission_id):
-    response = {}
-    status = 200
-    api_key = request.POST.get("key")
-    submission = models.Submission.objects.get(id=submission_id)
-    journal_key = submission.journal.ojs_key
-    if journal_key != api_key:
-        # Access forbidden
-        response["error"] = "Wrong key"
-        return JsonResponse(response, status=403)
-
-    ojs_jid = int(request.POST.get("user_id"))
-
-    # check, if author account already exists
-    author = models.Author.objects.filter(
-        submission=submission_id, ojs_jid=ojs_jid
-    ).first()
-    if author is None:
-        response["error"] = "Unknown reviewer"
-        status = 403
-        return JsonResponse(response, status=status)
-
-    revisions = models.SubmissionRevision.objects.filter(
-        submission_id=submission_id
+    return run_membership_operation(
+        request, submission_id, membership.remove_author
     )
-    if revisions is not None:
-        for revision in revisions:
-            AccessRight.objects.filter(
-                document=revision.document, user=author.user
-            ).delete()
 
-    author.delete()
 
-    return JsonResponse(response, status=status)
+# Run several membership operations on a submission at once. "operations" is
+# a JSON list of objects, each with the name of the operation in "operation"
+# and the parameters the corresponding endpoint takes. The operations are
+# applied in order and in one transaction. An operation that fails is rolled
+# back on its own. The response contains the status code and response of
+# each operation in "results".
+@csrf_exempt
+@require_POST
+def batch(request, submission_id):
+    api_key = request.POST.get("key")
+    journal_key = credentials.get_submission_credentials(submission_id).ojs_key
+    if journal_key != api_key:
+        # Access forbidden
+        return JsonResponse({"error": "Wrong key"}, status=403)
+    try:
+        operations = json.loads(request.POST.get("operations", ""))
+    except ValueError:
+        return JsonResponse({"error": "Invalid operations"}, status=400)
+    if not isinstance(operations, list) or not all(
+        isinstance(params, dict) for params in operations
+    ):
+        return JsonResponse({"error": "Invalid operations"}, status=400)
+    results = []
+    context = membership.SubmissionContext(submission_id)
+    with transaction.atomic():
+        for params in operations:
+            operation = membership.OPERATIONS.get(params.get("operation"))
+            if operation is None:
+                results.append({"status": 400, "error": "Unknown operation"})
+                continue
+            try:
+                with transaction.atomic():
+                    status, response = operation(context, params)
+                    context.save()
+            except models.SubmissionRevision.DoesNotExist:
+                status, response = 404, {"error": "Unknown revision"}
+                context.reset()
+            except (KeyError, TypeError, ValueError, AttributeError):
+                status, response = 400, {"error": "Invalid parameters"}
+                context.reset()
+            response["status"] = status
+            results.append(response)
+    return JsonResponse({"results": results}, status=200)